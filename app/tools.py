@@ -6,7 +6,7 @@ import traceback
 
 import requests
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 load_dotenv()
 api_key = os.getenv("DEEPSEEK_API_KEY") or os.getenv("OPENAI_KEY")
@@ -14,6 +14,8 @@ if not api_key:
     raise RuntimeError("Error: DeepSeek/OpenAI API key missing.")
 
 client = OpenAI(api_key=api_key, base_url="https://api.deepseek.com")
+# Used by the server: cancelling an await on it closes the upstream request.
+async_client = AsyncOpenAI(api_key=api_key, base_url="https://api.deepseek.com")
 
 def _mask_token(token: Optional[str]) -> str:
     if not token:
@@ -220,6 +222,23 @@ tools = [
             },
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "fetch",
+            "description": "Visit a URL and return a markdown version of the browsed page content.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "url": {
+                        "type": "string",
+                        "description": "The url of the web page to go get and return as markdown.",
+                    }
+                },
+                "required": ["url"]
+            },
+        }
+    },
 ]
 
 def send_messages(messages):
@@ -237,6 +256,21 @@ def get_weather(location: str) -> str:
     else:
         return "24 degrees"
 
+def fetch(url: str, *, verbose: bool = False) -> str:
+    """Fetch a web page as markdown through the Jina reader (https://r.jina.ai).
+
+    Env configuration:
+    - JINA_API_KEY (optional): bearer token, for higher rate limits
+    """
+    load_dotenv()
+    api_key = os.getenv("JINA_API_KEY")
+    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+    if verbose:
+        print("[fetch] URL:", url, file=sys.stderr)
+    resp = requests.get(f"https://r.jina.ai/{url}", headers=headers, timeout=30)
+    resp.raise_for_status()
+    return resp.text
+
 def run_with_tools(user_content: str, *, verbose: bool = False):
     messages = [{"role": "user", "content": user_content}]
     if verbose:
@@ -285,6 +319,12 @@ def run_with_tools(user_content: str, *, verbose: bool = False):
                         tool_output = json.dumps({"error": str(e)})
                 else:
                     tool_output = json.dumps({"error": "missing query"})
+            elif fn_name == "fetch":
+                url = args.get("url")
+                try:
+                    tool_output = fetch(url) if url else json.dumps({"error": "missing url"})
+                except Exception as e:
+                    tool_output = json.dumps({"error": str(e)})
             else:
                 tool_output = f"Unsupported tool: {fn_name}"
 
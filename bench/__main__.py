@@ -0,0 +1,87 @@
+"""Benchmark suite entry point.
+
+    python -m bench micro [--out micro.json]
+    python -m bench e2e [--requests 200 --concurrency 20] [--out e2e.json]
+    python -m bench run --out results.json
+    python -m bench compare baseline.json results.json --threshold 0.1
+
+`run` does micro + e2e and records commit/platform metadata. `compare`
+prints every metric that moved by more than --threshold and exits with
+status 1 if any of them got worse.
+"""
+import argparse
+import json
+import sys
+
+from bench.common import meta, write_results
+
+
+def _micro(args: argparse.Namespace) -> dict:
+    from bench import micro
+
+    return micro.run(args.only, args.repeat, args.target)
+
+
+def _e2e(args: argparse.Namespace) -> dict:
+    from bench import e2e
+
+    return e2e.run(args.url, args.port, args.requests, args.concurrency, args.message)
+
+
+def _compare(args: argparse.Namespace) -> int:
+    from bench.compare import compare
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    regressions, improvements = compare(base, new, args.threshold)
+    for label, rows in (("improved", improvements), ("REGRESSED", regressions)):
+        for path, old, cur, change in rows:
+            print(f"{label:>9}  {path}: {old:g} -> {cur:g} ({change:+.1%})")
+    print(f"{len(regressions)} regression(s), {len(improvements)} improvement(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Agent engine benchmarks.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    micro = argparse.ArgumentParser(add_help=False)
+    micro.add_argument("--only", nargs="+", default=[], help="run only these microbenchmarks")
+    micro.add_argument("--repeat", type=int, default=7)
+    micro.add_argument("--target", type=float, default=0.05, help="seconds per repeat")
+
+    e2e = argparse.ArgumentParser(add_help=False)
+    e2e.add_argument("--url", help="benchmark a running server instead of starting the stub server")
+    e2e.add_argument("--port", type=int, default=8123, help="port for the stub server")
+    e2e.add_argument("--requests", type=int, default=200)
+    e2e.add_argument("--concurrency", type=int, default=20)
+    e2e.add_argument("--message", default="How's the weather in Hangzhou?")
+
+    out = argparse.ArgumentParser(add_help=False)
+    out.add_argument("--out", help="write results JSON here instead of stdout")
+
+    sub.add_parser("micro", parents=[micro, out], help="microbenchmarks")
+    sub.add_parser("e2e", parents=[e2e, out], help="end-to-end load against stubbed upstreams")
+    sub.add_parser("run", parents=[micro, e2e, out], help="micro + e2e with metadata")
+    cmp = sub.add_parser("compare", help="fail on regressions against a baseline")
+    cmp.add_argument("base")
+    cmp.add_argument("new")
+    cmp.add_argument("--threshold", type=float, default=0.1, help="relative change that counts (0.1 = 10%%)")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        return _compare(args)
+    if args.command == "micro":
+        results = _micro(args)
+    elif args.command == "e2e":
+        results = _e2e(args)
+    else:
+        results = {"meta": meta(), "micro": _micro(args), "e2e": _e2e(args)}
+    write_results(results, args.out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
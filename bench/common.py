@@ -0,0 +1,54 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/max of `values` (empty dict if there are none)."""
+    if not values:
+        return {}
+    values = sorted(values)
+    pick = lambda pct: values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+    return {"p50": round(pick(50), 2), "p95": round(pick(95), 2), "p99": round(pick(99), 2), "max": round(values[-1], 2)}
+
+
+def status_kb(pid: Optional[int], field: str = "VmRSS") -> Optional[int]:
+    """A memory field (VmRSS, VmHWM, ...) of a process from /proc, in KiB."""
+    if not pid:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def meta() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5).stdout.strip()
+    except Exception:
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": round(time.time()),
+    }
+
+
+def write_results(results: Dict[str, Any], out: Optional[str]) -> None:
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if out:
+        with open(out, "w") as f:
+            f.write(text + "\n")
+        print(f"[bench] results written to {out}", file=sys.stderr)
+    else:
+        print(text)
@@ -0,0 +1,59 @@
+"""Compare two benchmark result files and flag regressions.
+
+Metrics are matched by their dotted path. The direction comes from the name
+of the last path segment that carries a unit: `*per_s` is better when
+higher; `*_ms`, `*_s`, `*_kb`, `*_ns` and `ns_per_op` are better when lower.
+`errors` counts are a regression whenever they rise, even from zero. Other
+counts, metadata and anything else are not compared.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+LOWER_IS_BETTER = ("_ms", "_s", "_kb", "_ns", "ns_per_op")
+
+
+def flatten(results: Any, prefix: str = "") -> Dict[str, float]:
+    flat: Dict[str, float] = {}
+    if isinstance(results, dict):
+        for key, value in results.items():
+            if key == "meta":
+                continue
+            flat.update(flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(results, (int, float)) and not isinstance(results, bool):
+        flat[prefix] = float(results)
+    return flat
+
+
+def direction(path: str) -> Optional[int]:
+    """+1 if higher is better, -1 if lower is better, None if not compared."""
+    if path.split(".")[-1] == "errors":
+        return -1
+    for segment in reversed(path.split(".")):
+        if segment.endswith("per_s"):
+            return 1
+        if segment.endswith(LOWER_IS_BETTER):
+            return -1
+    return None
+
+
+def compare(
+    base: Dict[str, Any], new: Dict[str, Any], threshold: float
+) -> Tuple[List[Tuple[str, float, float, float]], List[Tuple[str, float, float, float]]]:
+    """(regressions, improvements) as (path, base, new, relative change) beyond `threshold`."""
+    flat_base, flat_new = flatten(base), flatten(new)
+    regressions, improvements = [], []
+    for path in sorted(flat_base.keys() & flat_new.keys()):
+        sign = direction(path)
+        old, cur = flat_base[path], flat_new[path]
+        if sign is None:
+            continue
+        if old <= 0:
+            # No relative change from zero; only new errors are worth reporting
+            if path.split(".")[-1] == "errors" and cur > old:
+                regressions.append((path, old, cur, float("inf")))
+            continue
+        change = (cur - old) / old
+        if -sign * change > threshold:
+            regressions.append((path, old, cur, change))
+        elif sign * change > threshold:
+            improvements.append((path, old, cur, change))
+    return regressions, improvements
@@ -0,0 +1,130 @@
+"""End-to-end load against /api/chat and /api/chat/stream with stubbed upstreams.
+
+Starts `python -m bench.stubs` in a subprocess (unless --url points at a
+running server), drives each endpoint with a fixed number of concurrent
+clients and reports latency percentiles, throughput, the server's RSS and
+its event-loop lag during each phase (sampled by the stub server, read from
+/api/metrics and reset between phases).
+
+Needs `httpx`.
+"""
+import asyncio
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from bench.common import status_kb, summarize
+
+
+async def _chat(client: httpx.AsyncClient, url: str, message: str) -> Dict[str, float]:
+    started = time.perf_counter()
+    resp = await client.post(url + "/api/chat", json={"message": message})
+    resp.raise_for_status()
+    return {"latency_ms": (time.perf_counter() - started) * 1000}
+
+
+async def _chat_stream(client: httpx.AsyncClient, url: str, message: str) -> Dict[str, float]:
+    started = time.perf_counter()
+    first: Optional[float] = None
+    async with client.stream("POST", url + "/api/chat/stream", json={"message": message}) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if first is None and '"content_delta"' in line:
+                first = time.perf_counter()
+    done = time.perf_counter()
+    return {"latency_ms": (done - started) * 1000, "first_token_ms": ((first or done) - started) * 1000}
+
+
+async def drive(url: str, endpoint: str, requests: int, concurrency: int, message: str) -> Dict[str, Any]:
+    call = _chat if endpoint == "chat" else _chat_stream
+    samples: Dict[str, List[float]] = {}
+    errors = 0
+    queue = iter(range(requests))
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        nonlocal errors
+        for _ in queue:
+            try:
+                result = await call(client, url, message)
+            except Exception as e:
+                errors += 1
+                print(f"[bench.e2e] {endpoint} request failed: {e!r}", file=sys.stderr)
+                continue
+            for key, value in result.items():
+                samples.setdefault(key, []).append(value)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+    result: Dict[str, Any] = {key: summarize(values) for key, values in samples.items()}
+    result["requests_per_s"] = round((requests - errors) / elapsed, 2)
+    result["errors"] = errors
+    return result
+
+
+def _reset_lag(url: str) -> None:
+    # Only the stub server has this endpoint (and the probe that fills the samples)
+    try:
+        httpx.post(url + "/bench/lag/reset", timeout=10)
+    except Exception:
+        pass
+
+
+def _lag(url: str) -> Dict[str, float]:
+    try:
+        samples = httpx.get(url + "/api/metrics", timeout=10).json()["samples"]
+    except Exception:
+        return {}
+    lag = samples.get("event_loop_lag_ms") or {}
+    return {k: round(v, 2) for k, v in lag.items() if k != "count"}
+
+
+def start_stub_server(port: int) -> subprocess.Popen:
+    proc = subprocess.Popen([sys.executable, "-m", "bench.stubs", "--port", str(port)])
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("stub server exited during start-up")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return proc
+        except Exception:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("stub server did not come up within 30s")
+
+
+def run(
+    url: Optional[str] = None,
+    port: int = 8123,
+    requests: int = 200,
+    concurrency: int = 20,
+    message: str = "How's the weather in Hangzhou?",
+) -> Dict[str, Any]:
+    proc = None if url else start_stub_server(port)
+    url = url or f"http://127.0.0.1:{port}"
+    pid = proc.pid if proc else None
+    results: Dict[str, Any] = {}
+    try:
+        # A few requests first so imports, pools and caches are warm
+        asyncio.run(drive(url, "chat", min(requests, 10), min(concurrency, 5), message))
+        for endpoint in ("chat", "chat_stream"):
+            print(f"[bench.e2e] {endpoint}: {requests} requests, {concurrency} concurrent", file=sys.stderr)
+            _reset_lag(url)
+            entry = asyncio.run(drive(url, endpoint, requests, concurrency, message))
+            entry["event_loop_lag_ms"] = _lag(url)
+            if pid:
+                entry["rss_kb"] = status_kb(pid)
+            results[endpoint] = entry
+        if pid:
+            results["rss_peak_kb"] = status_kb(pid, "VmHWM")
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=10)
+    return results
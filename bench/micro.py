@@ -0,0 +1,126 @@
+"""Microbenchmarks for the hot pure-Python paths of the agent engine.
+
+Each case is timed timeit-style: the loop count is calibrated so one repeat
+takes about --target seconds, and the median and best ns/op over --repeat
+repeats are reported. A case whose imports fail (missing dependency) is
+reported as skipped rather than aborting the run.
+"""
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from bench.stubs import SEARCH_RESULTS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The modules under test build API clients at import time; they are never called.
+for _key in ("DEEPSEEK_API_KEY", "JINA_API_KEY", "BOCHA_API_KEY"):
+    os.environ.setdefault(_key, "bench")
+
+BOCHA_RESPONSE = {"code": 200, "data": {"_type": "SearchResponse", "webPages": {"value": SEARCH_RESULTS}}}
+
+
+def _extract_results() -> Callable[[], Any]:
+    from app.tools import _extract_results
+
+    return lambda: _extract_results(BOCHA_RESPONSE["data"])
+
+
+def _extract_webpages() -> Callable[[], Any]:
+    from server.tools import _extract_webpages
+
+    return lambda: _extract_webpages(BOCHA_RESPONSE)
+
+
+def _parse_is_full_answer() -> Callable[[], Any]:
+    # server/test.py is a script that imports its siblings as top-level modules
+    server_dir = os.path.join(ROOT, "server")
+    sys.path.insert(0, server_dir)
+    try:
+        spec = importlib.util.spec_from_file_location("bench_server_test", os.path.join(server_dir, "test.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(server_dir)
+    text = '{ "is_full_answer": "true" }'
+    return lambda: module.parse_is_full_answer(text)
+
+
+def _parse_verdicts() -> Callable[[], Any]:
+    from server.verify import parse_verdicts
+
+    text = json.dumps({"verdicts": [True, False, "yes", None, 1, "no", True, False]})
+    return lambda: parse_verdicts(text, 8)
+
+
+def _tool_dispatch() -> Callable[[], Any]:
+    import server.agent as agent
+    from bench.stubs import stub_get_weather
+
+    agent.TOOL_FUNCTIONS.update({"bocha_search": lambda query: SEARCH_RESULTS, "get_weather": stub_get_weather})
+    args = {"query": "How's the weather in Hangzhou?"}
+    return lambda: agent.resolve_tool("bocha_search", args)
+
+
+def _ndjson_encoding() -> Callable[[], Any]:
+    from server.streams import Run
+    from server.transports import ndjson_frame
+
+    run = Run("bench")
+    event = {"type": "content_delta", "text": "Hangzhou is cloudy with light rain, "}
+
+    def encode() -> bytes:
+        run.publish(event)
+        return ndjson_frame(run.last_id, run._buffer[-1][1])
+
+    return encode
+
+
+CASES: List[Tuple[str, Callable[[], Callable[[], Any]]]] = [
+    ("extract_results", _extract_results),
+    ("extract_webpages", _extract_webpages),
+    ("parse_is_full_answer", _parse_is_full_answer),
+    ("parse_verdicts", _parse_verdicts),
+    ("tool_dispatch", _tool_dispatch),
+    ("ndjson_encoding", _ndjson_encoding),
+]
+
+
+def measure(fn: Callable[[], Any], repeat: int, target: float) -> Dict[str, float]:
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= target / 10 or loops >= 1 << 24:
+            break
+        loops *= 10
+    loops = max(1, int(loops * target / max(elapsed, 1e-9)))
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        timings.append((time.perf_counter() - started) / loops * 1e9)
+    return {"ns_per_op": round(statistics.median(timings), 1), "min_ns": round(min(timings), 1), "loops": loops}
+
+
+def run(only: List[str] = (), repeat: int = 7, target: float = 0.05) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for name, setup in CASES:
+        if only and name not in only:
+            continue
+        try:
+            fn = setup()
+        except ImportError as e:
+            print(f"[bench.micro] {name}: skipped ({e})", file=sys.stderr)
+            results[name] = {"skipped": str(e)}
+            continue
+        results[name] = measure(fn, repeat, target)
+        print(f"[bench.micro] {name}: {results[name]['ns_per_op']:.0f} ns/op", file=sys.stderr)
+    return results
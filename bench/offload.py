@@ -0,0 +1,98 @@
+"""Event-loop lag and throughput of fetch post-processing, inline vs offloaded.
+
+Simulates fetch-heavy traffic in-process: each request "fetches" a few large
+synthetic markdown pages (network time is an asyncio.sleep) and runs the
+fetch post-processing stages on them, once inline on the event loop and
+once through the process pool. A probe task meanwhile measures how late the
+loop wakes it up, which is the delay every open stream would see.
+
+    python -m bench.offload --requests 32 --pages 3 --page-kb 300
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from typing import Any, Dict, List
+
+from bench.common import summarize, write_results
+from server.offload import Offloader
+from server.pages import FETCH_STAGES
+
+WORDS = ("weather forecast temperature humidity wind rain city report climate season "
+         "market price company revenue growth analysis model data search result page "
+         "杭州 天气 温度 湿度 城市 报告").split()
+
+
+def synthetic_page(size_kb: int, seed: int) -> str:
+    rng = random.Random(seed)
+    parts: List[str] = []
+    size = 0
+    while size < size_kb * 1024:
+        if rng.random() < 0.1:
+            para = f"![img](https://example.com/{rng.randrange(10**6)}.png)"
+        else:
+            words = [rng.choice(WORDS) for _ in range(rng.randrange(20, 80))]
+            if rng.random() < 0.3:
+                words.append(f"[link](https://example.com/{rng.randrange(10**6)})")
+            para = " ".join(words)
+        parts.append(para)
+        size += len(para.encode("utf-8")) + 2
+    return "\n\n".join(parts)
+
+
+async def _probe(lags: List[float], stop: asyncio.Event, interval: float = 0.005) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - started - interval) * 1000)
+
+
+async def run_mode(offloader: Offloader, pages: List[str], args: argparse.Namespace) -> Dict[str, Any]:
+    # Warm the pool up so process start-up is not part of the measurement
+    await offloader.run(FETCH_STAGES, pages[0][:1000], {"query": "warm up"})
+
+    async def request(i: int) -> None:
+        for j in range(args.pages):
+            await asyncio.sleep(args.fetch_ms / 1000)
+            page = pages[(i * args.pages + j) % len(pages)]
+            await offloader.run(FETCH_STAGES, page, {"query": "杭州 weather forecast"})
+
+    lags: List[float] = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*[request(i) for i in range(args.requests)])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+    return {
+        "processes": offloader.processes,
+        "elapsed_s": round(elapsed, 3),
+        "pages_per_s": round(args.requests * args.pages / elapsed, 2),
+        "loop_lag_ms": summarize(lags),
+    }
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    pages = [synthetic_page(args.page_kb, seed) for seed in range(8)]
+    results: Dict[str, Any] = {}
+    for name, processes in (("inline", 0), ("offload", args.processes)):
+        offloader = Offloader(processes=processes)
+        try:
+            results[name] = await run_mode(offloader, pages, args)
+        finally:
+            offloader.shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=32, help="concurrent fetch-heavy requests")
+    parser.add_argument("--pages", type=int, default=3, help="pages fetched per request")
+    parser.add_argument("--page-kb", type=int, default=300)
+    parser.add_argument("--fetch-ms", type=float, default=200.0, help="simulated network time per fetch")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--out", help="write results JSON here instead of stdout")
+    args = parser.parse_args()
+    write_results(asyncio.run(main(args)), args.out)
@@ -0,0 +1,132 @@
+"""Replay a recorded corpus against the chat API and flag regressions.
+
+Start the build under test in replay mode on the same recording, so every
+LLM and tool call is served from the log:
+
+    RECORD_MODE=replay RECORD_PATH=recordings.jsonl REPLAY_SPEED=1 uvicorn server.main:app --port 8000
+    python -m bench.replay recordings.jsonl --out build-b.json --baseline build-a.json
+
+Each session goes through the endpoint it was recorded on (/api/chat or
+/api/chat/stream), so it makes exactly the recorded calls. Without
+--baseline, each session is compared with the timings and round
+count captured in the recording itself. A session regresses when its
+latency grows by more than --threshold (and --min-ms), or when it needs more
+LLM rounds than the baseline. Exits with status 1 if anything regressed.
+
+Needs `httpx`.
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from server.recording import load_sessions
+
+
+def recorded_baseline(session: Dict[str, Any]) -> Dict[str, Any]:
+    entries = session["entries"]
+    end = max((e.get("t", 0) + e.get("ms", 0) for e in entries), default=0)
+    return {
+        "latency_ms": round(end, 1),
+        "rounds": sum(1 for e in entries if e["k"] == "llm"),
+        "tool_calls": sum(1 for e in entries if e["k"] == "tool"),
+    }
+
+
+def replay_session(client: httpx.Client, url: str, session: Dict[str, Any]) -> Dict[str, Any]:
+    """Replay one session through the endpoint it was recorded on."""
+    started = time.perf_counter()
+    if session.get("stream"):
+        status, body = _post_stream(client, url, session["message"])
+    else:
+        resp = client.post(url + "/api/chat", json={"message": session["message"]})
+        status = resp.status_code
+        try:
+            body = resp.json()
+        except Exception:
+            body = {"error": resp.text[:200]}
+    latency = (time.perf_counter() - started) * 1000
+    result: Dict[str, Any] = {"latency_ms": round(latency, 1), "status": status}
+    total = (body.get("usage") or {}).get("total") or {}
+    result["rounds"] = total.get("llm_calls")
+    result["tool_calls"] = total.get("tool_calls", 0)
+    if status != 200 or body.get("error"):
+        result["error"] = body.get("error") or "no response"
+    return result
+
+
+def _post_stream(client: httpx.Client, url: str, message: str) -> Tuple[int, Dict[str, Any]]:
+    # Collects the `usage` and `error` events of an NDJSON stream
+    body: Dict[str, Any] = {}
+    with client.stream("POST", url + "/api/chat/stream", json={"message": message}) as resp:
+        if resp.status_code != 200:
+            resp.read()
+            return resp.status_code, {"error": resp.text[:200]}
+        for line in resp.iter_lines():
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if event.get("type") == "usage":
+                body["usage"] = event
+            elif event.get("type") == "error":
+                body["error"] = event.get("error")
+            elif event.get("type") == "done":
+                break
+    return 200, body
+
+
+def compare(current: Dict[str, Any], base: Dict[str, Any], threshold: float, min_ms: float) -> List[str]:
+    problems: List[str] = []
+    if current.get("status") != 200 or current.get("error"):
+        problems.append(f"status {current.get('status')}: {current.get('error')}")
+    base_ms, cur_ms = base.get("latency_ms") or 0, current.get("latency_ms") or 0
+    if cur_ms > base_ms * (1 + threshold) and cur_ms - base_ms > min_ms:
+        problems.append(f"latency {base_ms:.0f}ms -> {cur_ms:.0f}ms")
+    if base.get("rounds") is not None and (current.get("rounds") or 0) > base["rounds"]:
+        problems.append(f"rounds {base['rounds']} -> {current.get('rounds')}")
+    return problems
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus", help="recording log (RECORD_PATH of a recorded server)")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--baseline", help="results JSON of a previous run to compare against")
+    parser.add_argument("--out", help="write this run's results JSON here")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative latency growth")
+    parser.add_argument("--min-ms", type=float, default=50.0, help="ignore latency growth below this")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args(argv)
+
+    sessions = load_sessions(args.corpus)
+    baseline: Dict[str, Any] = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["sessions"]
+
+    results: Dict[str, Any] = {}
+    regressions = 0
+    with httpx.Client(timeout=args.timeout) as client:
+        for session in sessions.values():
+            message = session["message"]
+            current = replay_session(client, args.url, session)
+            base = baseline.get(message) or recorded_baseline(session)
+            problems = compare(current, base, args.threshold, args.min_ms)
+            current["regressions"] = problems
+            results[message] = current
+            regressions += bool(problems)
+            status = "REGRESSED " + "; ".join(problems) if problems else "ok"
+            print(f"[bench.replay] {message[:60]!r}: {current['latency_ms']:.0f}ms, {current['rounds']} rounds - {status}", file=sys.stderr)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"url": args.url, "corpus": args.corpus, "sessions": results}, f, ensure_ascii=False, indent=2)
+    print(f"[bench.replay] {len(results)} sessions, {regressions} regressed", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
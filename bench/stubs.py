@@ -0,0 +1,175 @@
+"""Local stand-ins for DeepSeek and the tools, and a server that uses them.
+
+The stub LLM follows a fixed script: the first round asks for
+`bocha_search` (or `fetch`, if the message mentions it), the next round
+answers, and the streamed answer arrives token by token. A message that
+mentions `hold` never gets an answer: the run stays live until it is
+cancelled or hits its deadline, which is what idle-stream benchmarks follow. Latencies are
+simulated with sleeps so end-to-end numbers measure the server, not the
+network.
+
+    python -m bench.stubs --port 8123
+
+STUB_LLM_MS, STUB_TOKEN_MS, STUB_ANSWER_TOKENS and STUB_TOOL_MS tune the
+simulated latencies.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import zlib
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+LLM_MS = float(os.getenv("STUB_LLM_MS", "50"))
+TOKEN_MS = float(os.getenv("STUB_TOKEN_MS", "2"))
+ANSWER_TOKENS = int(os.getenv("STUB_ANSWER_TOKENS", "60"))
+TOOL_MS = float(os.getenv("STUB_TOOL_MS", "30"))
+
+SEARCH_RESULTS = [
+    {
+        "name": f"Result {i}: Hangzhou weather forecast",
+        "url": f"https://example.com/weather/{i}",
+        "snippet": "Hangzhou, cloudy with light rain, 24-31 degrees, humidity 80%. " * 3,
+        "siteName": "example.com",
+    }
+    for i in range(10)
+]
+
+
+def _usage(messages: List[Dict[str, Any]], completion_tokens: int) -> Dict[str, int]:
+    prompt_tokens = sum(len(str(m.get("content") or "")) for m in messages) // 4 + 200
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "prompt_cache_hit_tokens": prompt_tokens // 2,
+        "prompt_cache_miss_tokens": prompt_tokens - prompt_tokens // 2,
+    }
+
+
+def _tool_call(name: str, args: Dict[str, Any], index: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=f"call_{index}",
+        type="function",
+        function=SimpleNamespace(name=name, arguments=json.dumps(args, ensure_ascii=False)),
+    )
+
+
+class _Stream:
+    def __init__(self, messages: List[Dict[str, Any]]):
+        self._messages = messages
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        await asyncio.sleep(LLM_MS / 1000)
+        for i in range(ANSWER_TOKENS):
+            await asyncio.sleep(TOKEN_MS / 1000)
+            delta = SimpleNamespace(content=f"token{i} ")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+        yield SimpleNamespace(choices=[], usage=_usage(self._messages, ANSWER_TOKENS))
+
+    async def close(self) -> None:
+        pass
+
+
+class _Completions:
+    async def create(self, *, messages: List[Dict[str, Any]], stream: bool = False, tool_choice: str = "auto", **kwargs: Any) -> Any:
+        if stream:
+            return _Stream(messages)
+        await asyncio.sleep(LLM_MS / 1000)
+        question = next((m["content"] for m in messages if m["role"] == "user"), "")
+        if "hold" in question:
+            await asyncio.Event().wait()
+        tool_rounds = sum(1 for m in messages if m["role"] == "assistant")
+        if tool_choice != "none" and tool_rounds == 0:
+            if "fetch" in question:
+                call = _tool_call("fetch", {"url": "https://example.com/page"}, 0)
+            else:
+                call = _tool_call("bocha_search", {"query": question}, 0)
+            message = SimpleNamespace(role="assistant", content=None, tool_calls=[call])
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=_usage(messages, 20))
+        content = " ".join(f"token{i}" for i in range(ANSWER_TOKENS))
+        message = SimpleNamespace(role="assistant", content=content, tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=_usage(messages, ANSWER_TOKENS))
+
+
+class StubClient:
+    """Enough of AsyncOpenAI for server/agent.py."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=_Completions())
+
+
+def stub_bocha_search(query: str) -> List[Any]:
+    time.sleep(TOOL_MS / 1000)
+    return SEARCH_RESULTS
+
+
+def stub_get_weather(location: str) -> str:
+    return "24 degrees"
+
+
+def stub_fetch(url: str) -> str:
+    from bench.offload import synthetic_page
+
+    time.sleep(TOOL_MS / 1000)
+    return synthetic_page(200, zlib.crc32(url.encode("utf-8")) & 0xFF)
+
+
+def install() -> None:
+    """Point server/agent.py at the stubs."""
+    import server.agent as agent
+
+    agent.llm = StubClient()
+    agent.TOOL_FUNCTIONS.update({
+        "bocha_search": stub_bocha_search,
+        "get_weather": stub_get_weather,
+        "fetch": stub_fetch,
+    })
+
+
+async def _probe_loop_lag(interval: float = 0.01) -> None:
+    from server.metrics import metrics
+
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        metrics.observe("event_loop_lag_ms", (time.perf_counter() - started - interval) * 1000)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the chat server against stubbed upstreams.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8123)
+    args = parser.parse_args()
+
+    # The real clients are still constructed at import time; they never get called.
+    os.environ.setdefault("DEEPSEEK_API_KEY", "stub")
+    os.environ["VERIFY_MODE"] = "off"
+    os.environ["RECORD_MODE"] = "off"
+
+    import uvicorn
+    from server.main import app
+
+    install()
+
+    async def start_probe() -> None:
+        app.state.lag_probe = asyncio.create_task(_probe_loop_lag())
+
+    async def reset_lag() -> Dict[str, bool]:
+        # Lets bench/e2e.py sample the lag of each phase on its own
+        from server.metrics import metrics
+
+        metrics.reset("event_loop_lag_ms")
+        return {"ok": True}
+
+    app.router.on_startup.append(start_probe)
+    app.add_api_route("/bench/lag/reset", reset_lag, methods=["POST"])
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Compare the chat transports: per-turn latency and server memory.
+
+For each transport (NDJSON POST, SSE POST, one persistent WebSocket) this
+runs a number of sequential turns and reports time to first event and time
+to `done`. It then holds N idle clients open against the server and reports
+the server's RSS growth: idle keep-alive HTTP connections for NDJSON (what a
+browser keeps between turns), open `GET /api/chat/sse?run_id=...` streams
+following a run that is still waiting on the LLM for SSE, and open sockets
+for WebSocket.
+
+Run it against a server whose upstreams are stubbed, so the numbers measure
+the transport and not the LLM; the SSE idle clients need `bench.stubs`, whose
+LLM never answers a message that mentions `hold`:
+
+    ulimit -n 20000
+    python -m bench.transports --url http://localhost:8000 --server-pid <pid> --clients 5000
+
+Needs `httpx` and `websockets`.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+import websockets
+
+from bench.common import status_kb, summarize, write_results
+
+
+async def turn_ndjson(client: httpx.AsyncClient, url: str, message: str) -> Tuple[float, float]:
+    started = time.perf_counter()
+    first = None
+    async with client.stream("POST", url + "/api/chat/stream", json={"message": message}) as resp:
+        async for line in resp.aiter_lines():
+            if not line.strip():
+                continue
+            first = first or time.perf_counter()
+            if json.loads(line).get("type") == "done":
+                break
+    return (first - started) * 1000, (time.perf_counter() - started) * 1000
+
+
+async def turn_sse(client: httpx.AsyncClient, url: str, message: str) -> Tuple[float, float]:
+    started = time.perf_counter()
+    first = None
+    async with client.stream("POST", url + "/api/chat/sse", json={"message": message}) as resp:
+        async for line in resp.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            first = first or time.perf_counter()
+            if json.loads(line[6:]).get("type") == "done":
+                break
+    return (first - started) * 1000, (time.perf_counter() - started) * 1000
+
+
+async def turn_ws(ws: Any, message: str, conversation_id: str) -> Tuple[float, float]:
+    started = time.perf_counter()
+    first = None
+    await ws.send(json.dumps({"type": "chat", "conversation_id": conversation_id, "message": message}))
+    while True:
+        event = json.loads(await ws.recv())
+        if event.get("conversation_id") != conversation_id:
+            continue
+        first = first or time.perf_counter()
+        if event.get("type") in ("done", "error"):
+            break
+    return (first - started) * 1000, (time.perf_counter() - started) * 1000
+
+
+async def measure_turns(transport: str, url: str, message: str, turns: int) -> Dict[str, Any]:
+    first_ms: List[float] = []
+    done_ms: List[float] = []
+    if transport == "ws":
+        async with websockets.connect(_ws_url(url)) as ws:
+            for i in range(turns):
+                first, done = await turn_ws(ws, message, f"c{i}")
+                first_ms.append(first)
+                done_ms.append(done)
+    else:
+        turn = turn_ndjson if transport == "ndjson" else turn_sse
+        async with httpx.AsyncClient(timeout=None) as client:
+            for _ in range(turns):
+                first, done = await turn(client, url, message)
+                first_ms.append(first)
+                done_ms.append(done)
+    return {"first_event_ms": summarize(first_ms), "done_ms": summarize(done_ms)}
+
+
+def _ws_url(url: str) -> str:
+    return url.replace("http://", "ws://").replace("https://", "wss://") + "/api/chat/ws"
+
+
+async def _idle_http(host: str, port: int) -> asyncio.StreamWriter:
+    # One completed keep-alive request, then the connection sits idle.
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET / HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n".encode())
+    await writer.drain()
+    await reader.readuntil(b"\r\n\r\n")
+    return writer
+
+
+async def _open_sse(host: str, port: int, target: str) -> Tuple[asyncio.StreamWriter, Dict[str, str]]:
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+    await writer.drain()
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    if " 200 " not in head[0]:
+        writer.close()
+        raise RuntimeError(f"{target}: {head[0]}")
+    headers = {k.strip().lower(): v.strip() for k, _, v in (line.partition(":") for line in head[1:] if line)}
+    # Nobody reads these streams again; heartbeats pile up in the socket buffers
+    return writer, headers
+
+
+async def _idle_sse(host: str, port: int, batch: int) -> List[Any]:
+    # Every EventSource of the batch follows one run that is still waiting
+    # on the (stub) LLM, so the server holds a live stream per client.
+    seed, headers = await _open_sse(host, port, "/api/chat/sse?message=hold")
+    target = f"/api/chat/sse?run_id={headers['x-run-id']}"
+    followers = await asyncio.gather(*[_open_sse(host, port, target) for _ in range(batch - 1)], return_exceptions=True)
+    return [seed] + [f if isinstance(f, Exception) else f[0] for f in followers]
+
+
+async def measure_idle(transport: str, url: str, clients: int, pid: Optional[int], settle: float) -> Dict[str, Any]:
+    before = status_kb(pid)
+    parsed = urlparse(url)
+    held: List[Any] = []
+    failed = 0
+    started = time.perf_counter()
+    for i in range(0, clients, 200):
+        batch = min(200, clients - i)
+        if transport == "ws":
+            opened = await asyncio.gather(*[websockets.connect(_ws_url(url)) for _ in range(batch)], return_exceptions=True)
+        elif transport == "sse":
+            try:
+                opened = await _idle_sse(parsed.hostname, parsed.port or 80, batch)
+            except Exception as e:
+                opened = [e] * batch
+        else:
+            opened = await asyncio.gather(*[_idle_http(parsed.hostname, parsed.port or 80) for _ in range(batch)], return_exceptions=True)
+        for conn in opened:
+            if isinstance(conn, Exception):
+                failed += 1
+            else:
+                held.append(conn)
+    connect_s = time.perf_counter() - started
+    await asyncio.sleep(settle)
+    after = status_kb(pid)
+    for conn in held:
+        try:
+            if transport == "ws":
+                await conn.close()
+            else:
+                conn.close()
+        except Exception:
+            pass
+    result: Dict[str, Any] = {"clients": len(held), "failed": failed, "connect_s": round(connect_s, 2)}
+    if before is not None and after is not None:
+        result["rss_before_kb"] = before
+        result["rss_after_kb"] = after
+        result["rss_per_client_kb"] = round((after - before) / max(1, len(held)), 2)
+    return result
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for transport in args.transports:
+        print(f"[bench.transports] {transport}: {args.turns} turns", file=sys.stderr)
+        entry = await measure_turns(transport, args.url, args.message, args.turns)
+        if args.clients:
+            print(f"[bench.transports] {transport}: {args.clients} idle clients", file=sys.stderr)
+            entry["idle"] = await measure_idle(transport, args.url, args.clients, args.server_pid, args.settle)
+        results[transport] = entry
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--transports", nargs="+", default=["ndjson", "sse", "ws"], choices=["ndjson", "sse", "ws"])
+    parser.add_argument("--message", default="How's the weather in Hangzhou?")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--clients", type=int, default=5000, help="idle clients to hold open (0 to skip)")
+    parser.add_argument("--server-pid", type=int, help="server process id, for RSS readings")
+    parser.add_argument("--settle", type=float, default=5.0, help="seconds to wait before reading RSS")
+    parser.add_argument("--out", help="write results JSON here instead of stdout")
+    args = parser.parse_args()
+    write_results(asyncio.run(main(args)), args.out)
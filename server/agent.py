@@ -0,0 +1,268 @@
+from typing import Any, AsyncGenerator, Dict, Optional
+import os
+import json
+import time
+import asyncio
+
+from app.tools import async_client, tools as tool_schema, get_weather, bocha_search, fetch
+from server import recording
+from server.cancel import CancelScope
+from server.loop import LoopController
+from server.metrics import metrics
+from server.offload import offloader
+from server.pages import FETCH_STAGES
+from server.prompt import MODEL, PromptBuilder, freeze_tools
+from server.usage import Budget, RequestUsage
+
+
+# Serialized once so every request carries a byte-identical tool schema.
+TOOLS = freeze_tools(tool_schema)
+
+# Upstreams, wrapped for record/replay (see server/recording.py)
+llm = recording.wrap_client(async_client)
+TOOL_FUNCTIONS = {
+    "get_weather": recording.wrap_tool("get_weather", get_weather),
+    "bocha_search": recording.wrap_tool("bocha_search", bocha_search),
+    "fetch": recording.wrap_tool("fetch", fetch),
+}
+
+# CPU-bound post-processing of a tool's raw output, run in the offload pool
+# so it does not hold up the event loop (and every other stream).
+TOOL_STAGES = {
+    "fetch": FETCH_STAGES,
+}
+
+# Tool result for calls cut off (or never started) because the round ran out of time.
+DEADLINE_RESULT = json.dumps({"error": "timed out: no time left for this tool call"}, ensure_ascii=False)
+
+# Caps concurrent outbound tool calls (Bocha, Jina, ...) across all requests.
+_tool_slots = asyncio.Semaphore(int(os.getenv("TOOL_CONCURRENCY", "8")))
+
+
+def resolve_tool(name: str, args: Dict[str, Any]) -> str:
+    if name == "get_weather":
+        location = args.get("location")
+        return TOOL_FUNCTIONS["get_weather"](location) if location else ""
+    if name == "bocha_search":
+        query = args.get("query")
+        if not query:
+            return json.dumps({"error": "missing query"}, ensure_ascii=False)
+        try:
+            results = TOOL_FUNCTIONS["bocha_search"](query)
+            return json.dumps(results[:5] if isinstance(results, list) else results, ensure_ascii=False)
+        except Exception as e:
+            return json.dumps({"error": str(e)}, ensure_ascii=False)
+    if name == "fetch":
+        url = args.get("url")
+        if not url:
+            return json.dumps({"error": "missing url"}, ensure_ascii=False)
+        try:
+            return TOOL_FUNCTIONS["fetch"](url)
+        except Exception as e:
+            return json.dumps({"error": str(e)}, ensure_ascii=False)
+    return json.dumps({"error": f"Unsupported tool: {name}"}, ensure_ascii=False)
+
+
+def _parse_args(raw: str) -> Dict[str, Any]:
+    try:
+        args = json.loads(raw or "{}")
+    except Exception:
+        return {}
+    return args if isinstance(args, dict) else {}
+
+
+def _record_llm(usage: RequestUsage, resp_usage: Any) -> None:
+    usage.record_llm(resp_usage)
+    metrics.record_usage(resp_usage)
+
+
+async def _run_tool(
+    scope: CancelScope, name: str, args: Dict[str, Any], query: str, until: Optional[float] = None
+) -> str:
+    # Waiting for a slot counts against the scope and the round deadline too
+    acquire = asyncio.ensure_future(_tool_slots.acquire())
+    try:
+        await scope.guard(acquire, until)
+    except BaseException:
+        if acquire.done() and not acquire.cancelled() and acquire.exception() is None:
+            _tool_slots.release()
+        raise
+    try:
+        result = await scope.guard(asyncio.to_thread(resolve_tool, name, args), until)
+    finally:
+        _tool_slots.release()
+    stages = TOOL_STAGES.get(name)
+    if stages:
+        started = time.perf_counter()
+        result = await scope.guard(offloader.run(stages, result, {"query": query}), until)
+        metrics.observe(f"postprocess_ms.{name}", (time.perf_counter() - started) * 1000)
+    return result
+
+
+async def _guarded(stream_resp: Any, scope: CancelScope) -> AsyncGenerator[Any, None]:
+    iterator = stream_resp.__aiter__()
+    while True:
+        try:
+            chunk = await scope.guard(iterator.__anext__())
+        except StopAsyncIteration:
+            return
+        yield chunk
+
+
+async def _final_answer(
+    prompt: PromptBuilder,
+    usage: RequestUsage,
+    scope: CancelScope,
+    stream: bool,
+) -> AsyncGenerator[Dict[str, Any], None]:
+    # The tool schema is sent again (with tool_choice="none") so this request
+    # shares the cached prefix.
+    if not stream:
+        resp = await scope.guard(llm.chat.completions.create(
+            model=MODEL,
+            messages=prompt.messages,
+            tools=TOOLS,
+            tool_choice="none",
+        ))
+        _record_llm(usage, getattr(resp, "usage", None))
+        yield {"type": "content_delta", "text": resp.choices[0].message.content or ""}
+        return
+
+    started = time.perf_counter()
+    first_token = True
+    stream_resp = await scope.guard(llm.chat.completions.create(
+        model=MODEL,
+        messages=prompt.messages,
+        tools=TOOLS,
+        tool_choice="none",
+        stream=True,
+        stream_options={"include_usage": True},
+    ))
+    got_usage = False
+    try:
+        async for chunk in _guarded(stream_resp, scope):
+            if getattr(chunk, "usage", None):
+                got_usage = True
+                _record_llm(usage, chunk.usage)
+            try:
+                # OpenAI v1: delta.content holds incremental text
+                delta = chunk.choices[0].delta
+                text = getattr(delta, "content", None)
+            except Exception:
+                text = None
+            if text:
+                if first_token:
+                    first_token = False
+                    metrics.observe("first_token_latency_ms", (time.perf_counter() - started) * 1000)
+                yield {"type": "content_delta", "text": text}
+    finally:
+        # Closing the stream drops the upstream connection, so the provider
+        # stops generating (and billing) tokens nobody will read.
+        await stream_resp.close()
+    if not got_usage:
+        usage.record_llm(None)
+
+
+async def run_agent(
+    user_message: str,
+    *,
+    usage: RequestUsage,
+    budget: Budget,
+    scope: Optional[CancelScope] = None,
+    stream: bool = True,
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """Run the tool-call loop for one user message, yielding events.
+
+    Events are the NDJSON payloads of /api/chat/stream (`tool_call`,
+    `tool_result`, `content_delta`). When a budget runs out or the
+    LoopController ends the loop (round cap, no progress, deadline), the
+    model is asked for a best-effort answer without tools from what it has
+    so far; the reason is left in `usage.stopped`. An LLM or tool call that
+    would run into the time reserved for that answer is abandoned the same
+    way ("deadline", or "latency_budget" when the budget runs out first). Repeated tool calls are answered from the earlier
+    result.
+
+    All upstream work is awaited through `scope`; once it is cancelled the
+    run raises `Cancelled` without starting any further LLM or tool calls.
+    """
+    scope = scope or CancelScope()
+    recording.begin(user_message, stream)
+    prompt = PromptBuilder()
+    prompt.add_user(user_message)
+
+    # The latency budget is a deadline too; whichever comes first bounds the
+    # rounds and names the stop reason when a round is cut off.
+    deadline, cut_off = scope.deadline, "deadline"
+    budget_deadline = budget.deadline(usage)
+    if budget_deadline is not None and (deadline is None or budget_deadline < deadline):
+        deadline, cut_off = budget_deadline, "latency_budget"
+    loop = LoopController(deadline=deadline)
+    # Every tool round has to finish by then, leaving time for the final answer
+    until = loop.round_deadline()
+    while True:
+        usage.stopped = budget.exceeded(usage) or loop.next_round()
+        if usage.stopped == "deadline":
+            usage.stopped = cut_off
+        if usage.stopped:
+            break
+
+        try:
+            resp = await scope.guard(llm.chat.completions.create(
+                model=MODEL,
+                messages=prompt.messages,
+                tools=TOOLS,
+                tool_choice="auto",
+            ), until)
+        except asyncio.TimeoutError:
+            usage.stopped = cut_off
+            break
+        _record_llm(usage, getattr(resp, "usage", None))
+        msg = resp.choices[0].message
+        tool_calls = getattr(msg, "tool_calls", None)
+        if not tool_calls:
+            if stream:
+                # No tool calls; proceed to streaming final content
+                break
+            yield {"type": "content_delta", "text": msg.content or ""}
+            return
+
+        # Record the assistant tool call message
+        prompt.add_assistant(msg)
+
+        # Execute tools
+        for tc in tool_calls:
+            if usage.stopped:
+                # Out of time earlier in this round; every call still needs a result
+                prompt.add_tool_result(tc.id, DEADLINE_RESULT)
+                continue
+            scope.check()
+            fn_name = tc.function.name
+            args = _parse_args(tc.function.arguments)
+            yield {"type": "tool_call", "name": fn_name, "args": args}
+
+            result = loop.lookup(fn_name, args)
+            if result is not None:
+                metrics.incr(f"tool_calls_deduplicated.{fn_name}")
+                yield {"type": "tool_result", "name": fn_name, "result": result, "cached": True}
+            else:
+                started = time.perf_counter()
+                try:
+                    result = await _run_tool(scope, fn_name, args, user_message, until)
+                except asyncio.TimeoutError:
+                    usage.stopped = cut_off
+                    result = DEADLINE_RESULT
+                usage.record_tool(fn_name, result, (time.perf_counter() - started) * 1000)
+                metrics.incr(f"tool_calls.{fn_name}")
+                if not usage.stopped:
+                    loop.remember(fn_name, args, result)
+                yield {"type": "tool_result", "name": fn_name, "result": result}
+
+            prompt.add_tool_result(tc.id, result)
+        if usage.stopped:
+            break
+        loop.end_round()
+
+    if usage.stopped:
+        metrics.incr(f"loop_stops.{usage.stopped}")
+    async for event in _final_answer(prompt, usage, scope, stream):
+        yield event
@@ -0,0 +1,95 @@
+import os
+import time
+import asyncio
+from typing import Any, Awaitable, Optional
+
+
+# Hard wall-clock limit for one request. Unlike the soft latency budget in
+# server/usage.py (which still asks for a final answer), hitting this aborts
+# all outstanding work.
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "120"))
+
+
+class Cancelled(Exception):
+    """Raised inside a run once its CancelScope has been cancelled."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancelScope:
+    """Cooperative cancellation for one agent run.
+
+    The scope is cancelled explicitly (e.g. when the client disconnects) or
+    implicitly once its deadline passes. Work awaited through `guard()` is
+    abandoned as soon as that happens.
+    """
+
+    def __init__(self, deadline_seconds: Optional[float] = REQUEST_DEADLINE_SECONDS):
+        self.deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+        self.reason: Optional[str] = None
+        self._event = asyncio.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        if self.reason is None and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+        return self.reason is not None
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def cancel(self, reason: str) -> None:
+        if self.reason is None:
+            self.reason = reason
+            self._event.set()
+
+    def check(self) -> None:
+        if self.cancelled:
+            raise Cancelled(self.reason)
+
+    async def guard(self, aw: Awaitable[Any], until: Optional[float] = None) -> Any:
+        """Await `aw`, cancelling it if the scope is cancelled first.
+
+        Coroutines are cancelled at their current await (which closes any
+        open HTTP request); work running in a thread is abandoned and its
+        result discarded.
+
+        `until` (a `time.monotonic()` value) is a soft limit for this one
+        call: if it passes first, the work is abandoned the same way and
+        `asyncio.TimeoutError` is raised, but the scope stays live.
+        """
+        task = asyncio.ensure_future(aw)
+        if self.cancelled:
+            task.cancel()
+            raise Cancelled(self.reason)
+        timeout = self.remaining()
+        soft = until is not None and (self.deadline is None or until < self.deadline)
+        if soft:
+            timeout = max(0.0, until - time.monotonic())
+        waiter = asyncio.ensure_future(self._event.wait())
+        try:
+            done, _ = await asyncio.wait({task, waiter}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+            if not task.done():
+                task.cancel()
+        if task not in done:
+            if soft and not self._event.is_set():
+                raise asyncio.TimeoutError()
+            # Either cancel() was called or the wait timed out at the deadline
+            self.cancel("deadline")
+            raise Cancelled(self.reason)
+        return task.result()
+
+
+async def watch_disconnect(request: Any, scope: CancelScope, interval: float = 0.5) -> None:
+    """Cancel `scope` once the HTTP client goes away."""
+    while not scope.cancelled:
+        if await request.is_disconnected():
+            scope.cancel("disconnected")
+            return
+        await asyncio.sleep(interval)
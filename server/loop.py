@@ -0,0 +1,124 @@
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+
+# Hard cap on tool rounds; the loop usually stops earlier (see LoopController).
+MAX_ROUNDS = int(os.getenv("MAX_TOOL_ROUNDS", "8"))
+# Time kept back before the request deadline for the final answering round.
+FINAL_ANSWER_RESERVE_SECONDS = float(os.getenv("FINAL_ANSWER_RESERVE_SECONDS", "15"))
+
+# Terms of a text argument: single CJK characters or runs of letters/digits.
+_TERM = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]|[^\W_]+")
+
+
+def _is_url(value: str) -> bool:
+    return value.startswith(("http://", "https://"))
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        text = value.strip()
+        if _is_url(text.lower()):
+            # Only scheme and host are case-insensitive; path and query are not
+            parts = urlsplit(text)
+            userinfo, _, host = parts.netloc.rpartition("@")
+            netloc = f"{userinfo}@{host.lower()}" if userinfo else host.lower()
+            return urlunsplit((parts.scheme.lower(), netloc, parts.path, parts.query, ""))
+        return " ".join(text.lower().split())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def _similar(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    """Same call up to punctuation and word order.
+
+    URLs must match exactly (after normalization). Text arguments match only
+    if they contain the same terms: a term that appears in one call and not
+    in the other (a different company, a different page) means a different
+    question, however much else the two share.
+    """
+    if a.keys() != b.keys():
+        return False
+    for key in a:
+        if a[key] == b[key]:
+            continue
+        if not (isinstance(a[key], str) and isinstance(b[key], str)):
+            return False
+        if _is_url(a[key]) or _is_url(b[key]):
+            return False
+        terms_a, terms_b = set(_TERM.findall(a[key])), set(_TERM.findall(b[key]))
+        if not terms_a or terms_a != terms_b:
+            return False
+    return True
+
+
+class LoopController:
+    """Decides when the tool loop should stop and answers repeated tool calls.
+
+    The loop stops (and the caller forces a final round without tools) when:
+    - `max_rounds` tool rounds have run ("max_rounds"),
+    - a whole round only repeated earlier calls ("no_progress"), or
+    - another round would not fit before `deadline` while still leaving
+      `reserve` seconds for the final answer ("deadline").
+    """
+
+    def __init__(
+        self,
+        max_rounds: int = MAX_ROUNDS,
+        deadline: Optional[float] = None,
+        reserve: float = FINAL_ANSWER_RESERVE_SECONDS,
+    ):
+        self.max_rounds = max_rounds
+        self.deadline = deadline
+        self.reserve = reserve
+        self.rounds = 0
+        self.duplicates = 0
+        self._calls: List[Tuple[str, Dict[str, Any], str]] = []
+        self._round_started: Optional[float] = None
+        self._round_fresh = 0
+        self._round_times: List[float] = []
+        self._stalled = False
+
+    def next_round(self) -> Optional[str]:
+        """Start a round; returns the reason to stop instead, if any."""
+        if self.rounds >= self.max_rounds:
+            return "max_rounds"
+        if self._stalled:
+            return "no_progress"
+        if self.deadline is not None:
+            # Assume the next round takes as long as the slowest one so far
+            expected = max(self._round_times, default=0.0)
+            if time.monotonic() + expected + self.reserve >= self.deadline:
+                return "deadline"
+        self.rounds += 1
+        self._round_started = time.monotonic()
+        self._round_fresh = 0
+        return None
+
+    def round_deadline(self) -> Optional[float]:
+        """Time by which a round's LLM and tool calls must be done, if any."""
+        return self.deadline - self.reserve if self.deadline is not None else None
+
+    def end_round(self) -> None:
+        if self._round_started is not None:
+            self._round_times.append(time.monotonic() - self._round_started)
+        self._stalled = self._round_fresh == 0
+
+    def lookup(self, name: str, args: Dict[str, Any]) -> Optional[str]:
+        """Result of an earlier call that this one repeats, if any."""
+        normalized = _normalize(args)
+        for prev_name, prev_args, result in self._calls:
+            if prev_name == name and (prev_args == normalized or _similar(prev_args, normalized)):
+                self.duplicates += 1
+                return result
+        return None
+
+    def remember(self, name: str, args: Dict[str, Any], result: str) -> None:
+        self._round_fresh += 1
+        self._calls.append((name, _normalize(args), result))
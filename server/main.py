@@ -1,12 +1,19 @@
 from typing import Any, Dict, Optional, AsyncGenerator, List
-import json
 import asyncio
+from contextlib import aclosing
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
-from app.tools import client, tools as tool_schema, get_weather, bocha_search
+from server.agent import run_agent
+from server.cancel import Cancelled, CancelScope, watch_disconnect
+from server.metrics import metrics
+from server.offload import offloader
+from server.streams import Run, runs
+from server.transports import STREAM_HEADERS, WebSocketSession, ndjson_frame, sse_frame, stream_frames
+from server.usage import Budget, RequestUsage, ledger
+from server.verify import verifier
 
 
 app = FastAPI(title="LLM Tools Demo")
@@ -19,20 +26,12 @@ app.add_middleware(
 )
 
 
-def _resolve_tool(name: str, args: Dict[str, Any]) -> str:
-    if name == "get_weather":
-        location = args.get("location")
-        return get_weather(location) if location else ""
-    if name == "bocha_search":
-        query = args.get("query")
-        if not query:
-            return json.dumps({"error": "missing query"}, ensure_ascii=False)
-        try:
-            results = bocha_search(query)
-            return json.dumps(results[:5] if isinstance(results, list) else results, ensure_ascii=False)
-        except Exception as e:
-            return json.dumps({"error": str(e)}, ensure_ascii=False)
-    return json.dumps({"error": f"Unsupported tool: {name}"}, ensure_ascii=False)
+def _usage_event(usage: RequestUsage) -> Dict[str, Any]:
+    event: Dict[str, Any] = {"type": "usage", **usage.to_dict()}
+    session = ledger.record(usage)
+    if session is not None:
+        event["session"] = session
+    return event
 
 
 @app.post("/api/chat")
@@ -42,132 +41,190 @@ async def chat(request: Request):
     if not user_message:
         return JSONResponse({"error": "message required"}, status_code=400)
 
-    messages: List[Dict[str, Any]] = [{"role": "user", "content": user_message}]
-
-    # Tool-call loop (non-stream)
-    for _ in range(5):
-        resp = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=messages,
-            tools=tool_schema,
-            tool_choice="auto",
-        )
-        msg = resp.choices[0].message
-        tool_calls = getattr(msg, "tool_calls", None)
-        if not tool_calls:
-            return {"content": msg.content or ""}
-
-        # append the assistant message that contains tool_calls
-        messages.append({
-            "role": msg.role,
-            "content": msg.content,
-            "tool_calls": tool_calls,
-        })
-
-        # Execute tools and append results
-        for tc in tool_calls:
-            fn_name = tc.function.name
-            try:
-                args = json.loads(tc.function.arguments or "{}")
-            except Exception:
-                args = {}
-            result = _resolve_tool(fn_name, args)
-            messages.append({
-                "role": "tool",
-                "tool_call_id": tc.id,
-                "content": result,
-            })
-
-    return JSONResponse({"error": "max tool iterations reached"}, status_code=500)
+    usage = RequestUsage(session_id=body.get("session_id"))
+    scope = CancelScope()
+    watcher = asyncio.create_task(watch_disconnect(request, scope))
+    content: List[str] = []
+    try:
+        async for event in run_agent(user_message, usage=usage, budget=Budget(), scope=scope, stream=False):
+            if event["type"] == "content_delta":
+                content.append(event["text"])
+    except Cancelled as e:
+        metrics.incr(f"cancelled.{e.reason}")
+        ledger.record(usage)
+        return JSONResponse({"error": f"request cancelled: {e.reason}"}, status_code=504)
+    finally:
+        watcher.cancel()
+
+    answer = "".join(content)
+    result: Dict[str, Any] = {"content": answer}
+    if answer and verifier.should_verify():
+        if verifier.blocking:
+            verdict = await _verdict_event(user_message, answer, scope)
+            if verdict is not None:
+                verdict.pop("type")
+                result["verdict"] = verdict
+        else:
+            verifier.submit(user_message, answer)
+    usage_event = _usage_event(usage)
+    usage_event.pop("type")
+    result["usage"] = usage_event
+    return result
+
+
+async def _verdict_event(question: str, answer: str, scope: CancelScope) -> Optional[Dict[str, Any]]:
+    try:
+        verdict, cached = await scope.guard(verifier.verify(question, answer))
+    except Cancelled:
+        return None
+    return {"type": "verdict", "is_full_answer": verdict, "cached": cached}
+
+
+async def _execute(run: Run, user_message: str, usage: RequestUsage) -> None:
+    """Drive one agent run, publishing its events into the run's buffer."""
+    answer: List[str] = []
+    completed = False
+    try:
+        run.publish({"type": "start", "run_id": run.id})
+        try:
+            async with aclosing(run_agent(user_message, usage=usage, budget=Budget(), scope=run.scope)) as events:
+                async for event in events:
+                    if event["type"] == "content_delta":
+                        answer.append(event["text"])
+                    run.publish(event)
+            completed = True
+        except Cancelled as e:
+            metrics.incr(f"cancelled.{e.reason}")
+            if e.reason == "disconnected":
+                # Nobody is listening any more; just settle the accounting.
+                ledger.record(usage)
+                return
+            run.publish({"type": "error", "error": f"request cancelled: {e.reason}"})
+        except Exception as e:
+            print("[chat_stream] agent failed:", repr(e))
+            run.publish({"type": "error", "error": str(e)})
+        verify = completed and bool(answer) and verifier.should_verify()
+        if verify and verifier.blocking:
+            verdict = await _verdict_event(user_message, "".join(answer), run.scope)
+            if verdict is not None:
+                run.publish(verdict)
+        # Usage is reported last so it covers the final streaming round
+        run.publish(_usage_event(usage))
+        run.publish({"type": "done"})
+        if verify and not verifier.blocking:
+            # The answer is complete; the stream stays open for a late verdict
+            verdict = await _verdict_event(user_message, "".join(answer), run.scope)
+            if verdict is not None:
+                run.publish(verdict)
+    finally:
+        run.finish()
+
+
+def _start_run(user_message: str, session_id: Optional[str] = None) -> Run:
+    run = runs.create()
+    usage = RequestUsage(session_id=session_id)
+    run.task = asyncio.create_task(_execute(run, user_message, usage))
+    return run
+
+
+def _open_stream(body: Dict[str, Any], request: Request):
+    """Start a run from `body`, or find the one it resumes.
+
+    Returns `(run, last_event_id)`, or a JSONResponse describing the error.
+    """
+    run_id: Optional[str] = body.get("run_id")
+    if run_id:
+        # Resume: replay everything after last_event_id, then follow live
+        run = runs.get(run_id)
+        if run is None:
+            return JSONResponse({"error": "unknown run"}, status_code=404)
+        try:
+            last_event_id = int(body.get("last_event_id") or request.headers.get("last-event-id") or 0)
+        except ValueError:
+            return JSONResponse({"error": "invalid last_event_id"}, status_code=400)
+        if not run.can_resume(last_event_id):
+            return JSONResponse({"error": "events no longer buffered"}, status_code=410)
+        metrics.incr("stream_resumes")
+        return run, last_event_id
+
+    user_message: str = (body.get("message") or "").strip()
+    if not user_message:
+        return JSONResponse({"error": "message required"}, status_code=400)
+    return _start_run(user_message, body.get("session_id")), 0
 
 
 @app.post("/api/chat/stream")
 async def chat_stream(request: Request):
-    body = await request.json()
-    user_message: str = body.get("message", "").strip()
-    if not user_message:
-        return JSONResponse({"error": "message required"}, status_code=400)
-
-    async def generate() -> AsyncGenerator[bytes, None]:
-        # Emit a start event
-        yield (json.dumps({"type": "start"}) + "\n").encode("utf-8")
-
-        messages: List[Dict[str, Any]] = [{"role": "user", "content": user_message}]
-
-        # Tool-call loop (non-stream phase)
-        for _ in range(5):
-            resp = client.chat.completions.create(
-                model="deepseek-chat",
-                messages=messages,
-                tools=tool_schema,
-                tool_choice="auto",
-            )
-            msg = resp.choices[0].message
-            tool_calls = getattr(msg, "tool_calls", None)
-            if not tool_calls:
-                # No tool calls; proceed to streaming final content
-                break
-
-            # Record the assistant tool call message
-            messages.append({
-                "role": msg.role,
-                "content": msg.content,
-                "tool_calls": tool_calls,
-            })
-
-            # Execute tools
-            for tc in tool_calls:
-                fn_name = tc.function.name
-                try:
-                    args = json.loads(tc.function.arguments or "{}")
-                except Exception:
-                    args = {}
-                # Stream a tool_call event
-                yield (json.dumps({
-                    "type": "tool_call",
-                    "name": fn_name,
-                    "args": args,
-                }, ensure_ascii=False) + "\n").encode("utf-8")
-
-                result = _resolve_tool(fn_name, args)
-                # Stream a tool_result event
-                yield (json.dumps({
-                    "type": "tool_result",
-                    "name": fn_name,
-                    "result": result,
-                }, ensure_ascii=False) + "\n").encode("utf-8")
-
-                messages.append({
-                    "role": "tool",
-                    "tool_call_id": tc.id,
-                    "content": result,
-                })
-
-        # Now stream final content tokens
-        stream = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=messages,
-            stream=True,
-        )
-        try:
-            for chunk in stream:
-                try:
-                    # OpenAI v1: delta.content holds incremental text
-                    delta = chunk.choices[0].delta
-                    text = getattr(delta, "content", None)
-                except Exception:
-                    text = None
-                if text:
-                    yield (json.dumps({"type": "content_delta", "text": text}, ensure_ascii=False) + "\n").encode("utf-8")
-                await asyncio.sleep(0)
-        finally:
-            yield (json.dumps({"type": "done"}) + "\n").encode("utf-8")
-
-    return StreamingResponse(generate(), media_type="application/x-ndjson")
+    opened = _open_stream(await request.json(), request)
+    if isinstance(opened, JSONResponse):
+        return opened
+    run, last_event_id = opened
+    return StreamingResponse(
+        stream_frames(run, last_event_id, request, ndjson_frame),
+        media_type="application/x-ndjson",
+        headers={"X-Run-Id": run.id, **STREAM_HEADERS},
+    )
+
+
+@app.post("/api/chat/sse")
+async def chat_sse(request: Request):
+    return _sse_response(_open_stream(await request.json(), request), request)
+
+
+@app.get("/api/chat/sse")
+async def chat_sse_get(request: Request):
+    # GET form for EventSource: `?message=...` starts a run, `?run_id=...`
+    # resumes one (EventSource sends Last-Event-ID on its own). EventSource
+    # also reconnects to the same URL whenever a stream ends, and only a 204
+    # stops it: a reconnect must never start the run again, and a finished
+    # run that was fully delivered has nothing left to send.
+    params = dict(request.query_params)
+    if not params.get("run_id") and "last-event-id" in request.headers:
+        return Response(status_code=204)
+    opened = _open_stream(params, request)
+    if not isinstance(opened, JSONResponse):
+        run, last_event_id = opened
+        if run.finished and last_event_id >= run.last_id:
+            return Response(status_code=204)
+    return _sse_response(opened, request)
+
+
+def _sse_response(opened: Any, request: Request):
+    if isinstance(opened, JSONResponse):
+        return opened
+    run, last_event_id = opened
+    return StreamingResponse(
+        stream_frames(run, last_event_id, request, sse_frame),
+        media_type="text/event-stream",
+        headers={"X-Run-Id": run.id, **STREAM_HEADERS},
+    )
+
+
+@app.websocket("/api/chat/ws")
+async def chat_ws(websocket: WebSocket):
+    await websocket.accept()
+    await WebSocketSession(websocket, _start_run).serve()
+
+
+@app.get("/api/usage/{session_id}")
+def get_session_usage(session_id: str):
+    session = ledger.get(session_id)
+    if session is None:
+        return JSONResponse({"error": "unknown session"}, status_code=404)
+    return session
+
+
+@app.get("/api/metrics")
+def get_metrics():
+    return metrics.snapshot()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    offloader.shutdown()
 
 
 # Convenience root
 @app.get("/")
 def root():
     return {"status": "ok"}
-
@@ -0,0 +1,71 @@
+import threading
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict
+
+from server.usage import TOKEN_FIELDS, token_field
+
+
+def _percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+class Metrics:
+    """Process-local counters and sample windows, exposed at /api/metrics."""
+
+    def __init__(self, window: int = 1024):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            self._samples[name].append(value)
+
+    def reset(self, name: str) -> None:
+        """Forget the samples collected so far for `name`."""
+        with self._lock:
+            self._samples.pop(name, None)
+
+    def record_usage(self, usage: Any) -> None:
+        """Record token counts from an upstream `usage` object.
+
+        DeepSeek reports `prompt_cache_hit_tokens` / `prompt_cache_miss_tokens`
+        next to the standard OpenAI fields.
+        """
+        if usage is None:
+            return
+        self.incr("llm_calls")
+        for field in TOKEN_FIELDS:
+            value = token_field(usage, field)
+            if value:
+                self.incr(field, value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            samples = {k: sorted(v) for k, v in self._samples.items()}
+        hit = counters.get("prompt_cache_hit_tokens", 0)
+        miss = counters.get("prompt_cache_miss_tokens", 0)
+        return {
+            "counters": counters,
+            "prompt_cache_hit_ratio": (hit / (hit + miss)) if (hit + miss) else 0.0,
+            "samples": {
+                name: {
+                    "count": len(values),
+                    "p50": _percentile(values, 50),
+                    "p95": _percentile(values, 95),
+                    "max": values[-1] if values else 0.0,
+                }
+                for name, values in samples.items()
+            },
+        }
+
+
+metrics = Metrics()
@@ -0,0 +1,77 @@
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Dict, Optional, Sequence
+
+
+# Worker processes for CPU-bound tool post-processing; 0 runs stages inline
+# on the event loop.
+OFFLOAD_PROCESSES = int(os.getenv("OFFLOAD_PROCESSES", str(os.cpu_count() or 1)))
+# Payloads at least this large go through shared memory instead of pickling.
+OFFLOAD_SHM_BYTES = int(os.getenv("OFFLOAD_SHM_BYTES", str(64 * 1024)))
+
+Stage = Callable[[str, Dict[str, Any]], str]
+
+
+def run_pipeline(stages: Sequence[Stage], payload: str, context: Dict[str, Any]) -> str:
+    for stage in stages:
+        payload = stage(payload, context)
+    return payload
+
+
+def _worker(stages: Sequence[Stage], shm_name: Optional[str], size: int, payload: Optional[str], context: Dict[str, Any]) -> str:
+    if shm_name is not None:
+        shm = SharedMemory(name=shm_name)
+        try:
+            payload = bytes(shm.buf[:size]).decode("utf-8")
+        finally:
+            shm.close()
+    return run_pipeline(stages, payload or "", context)
+
+
+class Offloader:
+    """Runs post-processing stages in a process pool sized to the cores.
+
+    Stages must be module-level functions so they can be pickled by
+    reference. The pool uses the spawn start method, since forking a process
+    that already runs threads (asyncio.to_thread) is not safe.
+    """
+
+    def __init__(self, processes: int = OFFLOAD_PROCESSES, shm_bytes: int = OFFLOAD_SHM_BYTES):
+        self.processes = processes
+        self._shm_bytes = shm_bytes
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def run(self, stages: Sequence[Stage], payload: str, context: Dict[str, Any]) -> str:
+        if not stages:
+            return payload
+        if self.processes <= 0:
+            return run_pipeline(stages, payload, context)
+
+        loop = asyncio.get_running_loop()
+        data = payload.encode("utf-8")
+        if len(data) < self._shm_bytes:
+            return await loop.run_in_executor(self._get_pool(), _worker, stages, None, 0, payload, context)
+
+        shm = SharedMemory(create=True, size=len(data))
+        try:
+            shm.buf[:len(data)] = data
+            return await loop.run_in_executor(self._get_pool(), _worker, stages, shm.name, len(data), None, context)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+offloader = Offloader()
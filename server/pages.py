@@ -0,0 +1,146 @@
+"""Post-processing stages for fetched web pages.
+
+Each stage is a plain `(text, context) -> text` function defined at module
+level, so it can be shipped to a worker process (see server/offload.py).
+"""
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List
+
+
+# Pages longer than this are cut down to their most relevant chunks.
+MAX_PAGE_TOKENS = 2000
+CHUNK_TOKENS = 200
+
+_IMAGE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_LINK = re.compile(r"\[([^\]]*)\]\((?:[^()]|\([^)]*\))*\)")
+_BARE_URL = re.compile(r"<https?://[^>]+>")
+_TRAILING_SPACE = re.compile(r"[ \t]+\n")
+_BLANK_LINES = re.compile(r"\n{3,}")
+# Roughly one token per CJK character, per word, or per punctuation mark.
+_TOKEN = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]|[^\W_]+|[^\w\s]")
+_TERM = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]|[^\W_]{2,}")
+_SENTENCE = re.compile(r"[^.!?\u3002\uff01\uff1f]*(?:[.!?\u3002\uff01\uff1f]+|$)\s*")
+
+
+def count_tokens(text: str) -> int:
+    return len(_TOKEN.findall(text))
+
+
+def clean_markdown(text: str, context: Dict[str, Any]) -> str:
+    """Drop images and link targets, and squeeze whitespace."""
+    text = _IMAGE.sub("", text)
+    text = _LINK.sub(r"\1", text)
+    text = _BARE_URL.sub("", text)
+    text = _TRAILING_SPACE.sub("\n", text)
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+def _token_windows(text: str, max_tokens: int) -> List[str]:
+    starts = [m.start() for m in _TOKEN.finditer(text)][::max_tokens]
+    if not starts:
+        return [text]
+    starts[0] = 0
+    return [text[a:b] for a, b in zip(starts, starts[1:] + [len(text)])]
+
+
+def _split_long(text: str, max_tokens: int) -> List[str]:
+    """Cut an oversized paragraph into pieces of at most `max_tokens`.
+
+    Cuts at line breaks first (tables, lists and code often have no blank
+    lines), then at sentence ends, and as a last resort every `max_tokens`
+    tokens.
+    """
+    segments: List[str] = []
+    for line in text.splitlines(keepends=True):
+        if count_tokens(line) <= max_tokens:
+            segments.append(line)
+            continue
+        for sentence in filter(None, _SENTENCE.findall(line)):
+            if count_tokens(sentence) <= max_tokens:
+                segments.append(sentence)
+            else:
+                segments.extend(_token_windows(sentence, max_tokens))
+    pieces: List[str] = []
+    current, size = "", 0
+    for segment in segments:
+        n = count_tokens(segment)
+        if current and size + n > max_tokens:
+            pieces.append(current)
+            current, size = "", 0
+        current += segment
+        size += n
+    pieces.append(current)
+    return [p.strip() for p in pieces if p.strip()]
+
+
+def chunk(text: str, max_tokens: int = CHUNK_TOKENS) -> List[str]:
+    """Split on paragraphs, merging small ones up to `max_tokens` each.
+
+    Paragraphs longer than `max_tokens` are split further (see `_split_long`).
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for para in text.split("\n\n"):
+        n = count_tokens(para)
+        pieces = _split_long(para, max_tokens) if n > max_tokens else [para]
+        for piece in pieces:
+            n = count_tokens(piece) if len(pieces) > 1 else n
+            if current and size + n > max_tokens:
+                chunks.append("\n\n".join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += n
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _terms(text: str) -> List[str]:
+    return [t.lower() for t in _TERM.findall(text)]
+
+
+def select_relevant(text: str, context: Dict[str, Any]) -> str:
+    """Keep the chunks most relevant to `context["query"]` within the token budget.
+
+    Chunks are scored with BM25 against the query and kept in page order.
+    A non-empty page never comes back empty: if no chunk fits, the page is
+    truncated to the budget instead.
+    """
+    budget = int(context.get("max_tokens") or MAX_PAGE_TOKENS)
+    if count_tokens(text) <= budget:
+        return text
+    chunks = chunk(text, min(CHUNK_TOKENS, budget))
+    query = set(_terms(context.get("query") or ""))
+    docs = [Counter(_terms(c)) for c in chunks]
+    avg_len = sum(sum(d.values()) for d in docs) / max(1, len(docs))
+    df = Counter(term for d in docs for term in query if term in d)
+
+    def score(doc: Counter) -> float:
+        length = sum(doc.values())
+        total = 0.0
+        for term in query:
+            tf = doc.get(term, 0)
+            if not tf:
+                continue
+            idf = math.log(1 + (len(docs) - df[term] + 0.5) / (df[term] + 0.5))
+            total += idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * length / max(1.0, avg_len)))
+        return total
+
+    # Earlier chunks win ties, so a page without matches keeps its beginning
+    ranked = sorted(range(len(chunks)), key=lambda i: (-score(docs[i]), i))
+    keep, used = [], 0
+    for i in ranked:
+        n = count_tokens(chunks[i])
+        if used + n > budget:
+            continue
+        keep.append(i)
+        used += n
+    if not keep:
+        return _token_windows(text, budget)[0].strip() if budget > 0 else ""
+    return "\n\n".join(chunks[i] for i in sorted(keep))
+
+
+FETCH_STAGES = (clean_markdown, select_relevant)
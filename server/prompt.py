@@ -0,0 +1,68 @@
+import json
+from typing import Any, Dict, List
+
+
+# DeepSeek caches prompt prefixes on its side and bills cache hits at a
+# fraction of the normal price. A hit needs the leading bytes of the request
+# to match a previous one exactly, so everything here is built to keep the
+# prefix (system prompt -> tool schema -> history) identical across rounds
+# and across requests.
+
+MODEL = "deepseek-chat"
+
+SYSTEM_PROMPT = "You are a helpful assistant. You answer in a clear and concise way. Match your output language with user's question."
+
+
+def freeze_tools(tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Return a canonical copy of a tool schema list.
+
+    The schema is serialized once with sorted keys and parsed back, so every
+    request sends the very same object in the very same key order.
+    """
+    canonical = json.dumps(tools, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return json.loads(canonical)
+
+
+def _tool_call_dict(tc: Any) -> Dict[str, Any]:
+    if isinstance(tc, dict):
+        fn = tc.get("function") or {}
+        return {
+            "id": tc.get("id"),
+            "type": tc.get("type") or "function",
+            "function": {"name": fn.get("name"), "arguments": fn.get("arguments") or "{}"},
+        }
+    return {
+        "id": tc.id,
+        "type": getattr(tc, "type", None) or "function",
+        "function": {"name": tc.function.name, "arguments": tc.function.arguments or "{}"},
+    }
+
+
+class PromptBuilder:
+    """Append-only message history behind a fixed system prompt.
+
+    Messages are only ever appended; earlier entries (in particular tool
+    outputs) are never rewritten, so each round's prompt is a strict
+    extension of the previous one.
+    """
+
+    def __init__(self, system_prompt: str = SYSTEM_PROMPT):
+        self._messages: List[Dict[str, Any]] = [{"role": "system", "content": system_prompt}]
+
+    @property
+    def messages(self) -> List[Dict[str, Any]]:
+        return self._messages
+
+    def add_user(self, content: str) -> None:
+        self._messages.append({"role": "user", "content": content})
+
+    def add_assistant(self, message: Any) -> None:
+        """Record an assistant message, normalizing SDK tool calls to plain dicts."""
+        entry: Dict[str, Any] = {"role": "assistant", "content": getattr(message, "content", None)}
+        tool_calls = getattr(message, "tool_calls", None)
+        if tool_calls:
+            entry["tool_calls"] = [_tool_call_dict(tc) for tc in tool_calls]
+        self._messages.append(entry)
+
+    def add_tool_result(self, tool_call_id: str, content: str) -> None:
+        self._messages.append({"role": "tool", "tool_call_id": tool_call_id, "content": str(content)})
@@ -0,0 +1,436 @@
+"""Record/replay of upstream traffic (LLM calls and tools) for one agent run.
+
+RECORD_MODE=record appends every LLM request/response and tool call of each
+run to RECORD_PATH; RECORD_MODE=replay serves them back from that log instead
+of calling the live services, so a recorded session can be re-run against a
+new build deterministically. REPLAY_SPEED scales the recorded timings
+(1 = original speed, 0 = as fast as possible).
+
+The log is JSON lines (gzip if the path ends in .gz), one entry per call:
+
+  {"k": "session", "s": <id>, "message": ..., "stream": <bool>, "ts": <unix time>}
+  {"k": "llm", "s": <id>, "t": <ms since start>, "ms": <duration>, "new": [<messages since last call>], "opts": {...}, "res": {...}}
+  {"k": "llm", ..., "chunks": [[<ms since call>, <chunk>], ...]}        (streamed)
+  {"k": "llm", ..., "error": <str(exception)>, "error_type": ...}      (the call raised)
+  {"k": "llm", ..., "cancelled": true}                                 (cut off by a deadline or disconnect)
+  {"k": "tool", "s": <id>, "t": ..., "ms": ..., "name": ..., "args": [...], "res": ...}
+  {"k": "tool", ..., "error": <str(exception)>, "error_type": ...}     (the tool raised)
+  {"k": "llm", "key": <request hash>, "ms": ..., "res": {...}}           (outside a run)
+
+LLM calls that do not belong to a run (the answer judge, which batches
+answers from many runs) are matched by a hash of the whole request
+instead of by position in a session.
+"""
+import os
+import gzip
+import json
+import time
+import uuid
+import hashlib
+import asyncio
+import threading
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+RECORD_MODE = os.getenv("RECORD_MODE", "off").strip().lower()
+RECORD_PATH = os.getenv("RECORD_PATH", "recordings.jsonl")
+REPLAY_SPEED = float(os.getenv("REPLAY_SPEED", "1"))
+
+
+class ReplayMiss(Exception):
+    """The recording has no entry for a call made during replay."""
+
+
+class RecordedError(Exception):
+    """A tool call that raised while recording, raised again on replay."""
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def read_log(path: str) -> Iterator[Dict[str, Any]]:
+    with _open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def load_sessions(path: str) -> Dict[str, Dict[str, Any]]:
+    """Group a log into sessions: {id: {"message", "stream", "ts", "entries": [...]}}.
+
+    `stream` tells whether the run was recorded on /api/chat/stream (or
+    another streaming transport) rather than /api/chat; it has to be
+    replayed the same way to make the same calls.
+    """
+    sessions: Dict[str, Dict[str, Any]] = {}
+    for entry in read_log(path):
+        if entry["k"] == "session":
+            sessions[entry["s"]] = {
+                "id": entry["s"],
+                "message": entry["message"],
+                "stream": entry.get("stream"),
+                "ts": entry.get("ts"),
+                "entries": [],
+            }
+        elif entry.get("s") in sessions:
+            sessions[entry["s"]]["entries"].append(entry)
+    for session in sessions.values():
+        if session["stream"] is None:
+            # Older logs: only streaming runs end with a streamed call
+            llm = [e for e in session["entries"] if e["k"] == "llm"]
+            session["stream"] = bool(llm) and "chunks" in llm[-1]
+    return sessions
+
+
+class _Log:
+    """Append-only writer shared by all sessions (tools log from threads)."""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        line = _dumps(entry) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = _open(self._path, "a")
+            self._file.write(line)
+            self._file.flush()
+
+
+class _Recorder:
+    def __init__(self, log: _Log, message: str, stream: bool):
+        self.id = uuid.uuid4().hex[:12]
+        self.started = time.perf_counter()
+        self._log = log
+        self._sent = 0
+        log.append({"k": "session", "s": self.id, "message": message, "stream": stream, "ts": round(time.time(), 3)})
+
+    def offset_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+    def llm_entry(self, kwargs: Dict[str, Any], t: float) -> Dict[str, Any]:
+        # Prompts are append-only, so only the messages added since the
+        # previous call are stored; the tool schema is stored as a hash.
+        messages = kwargs.get("messages") or []
+        entry = {
+            "k": "llm",
+            "s": self.id,
+            "t": t,
+            "new": messages[self._sent:],
+            "opts": {k: v for k, v in kwargs.items() if k not in ("messages", "tools")},
+        }
+        if kwargs.get("tools"):
+            entry["tools"] = hashlib.sha1(_dumps(kwargs["tools"]).encode("utf-8")).hexdigest()[:12]
+        self._sent = len(messages)
+        return entry
+
+    def write(self, entry: Dict[str, Any]) -> None:
+        self._log.append(entry)
+
+
+class _Player:
+    def __init__(self, session: Dict[str, Any], speed: float):
+        self.id = session["id"]
+        self.speed = speed
+        self._llm = [e for e in session["entries"] if e["k"] == "llm"]
+        self._tools = [e for e in session["entries"] if e["k"] == "tool"]
+        self._lock = threading.Lock()
+
+    def delay(self, ms: float) -> float:
+        return ms / 1000.0 / self.speed if self.speed > 0 else 0.0
+
+    def next_llm(self) -> Dict[str, Any]:
+        with self._lock:
+            if not self._llm:
+                raise ReplayMiss(f"session {self.id}: no more recorded LLM calls")
+            return self._llm.pop(0)
+
+    def next_tool(self, name: str, args: List[Any]) -> Dict[str, Any]:
+        # Prefer an exact match so concurrent tool calls replay correctly
+        with self._lock:
+            for matcher in (lambda e: e["name"] == name and e["args"] == args, lambda e: e["name"] == name):
+                for i, entry in enumerate(self._tools):
+                    if matcher(entry):
+                        return self._tools.pop(i)
+        raise ReplayMiss(f"session {self.id}: no recorded {name} call for {args}")
+
+
+_session: ContextVar[Any] = ContextVar("recording_session", default=None)
+_log = _Log(RECORD_PATH) if RECORD_MODE == "record" else None
+_replay_index: Optional[Dict[str, Dict[str, Any]]] = None
+_keyed_index: Optional[Dict[str, Dict[str, Any]]] = None
+
+
+def begin(message: str, stream: bool = True) -> None:
+    """Start recording (or replaying) the run for `message` in this context.
+
+    `stream` is whether the run streams its final answer (see run_agent).
+    """
+    global _replay_index
+    if RECORD_MODE == "record":
+        _session.set(_Recorder(_log, message, stream))
+    elif RECORD_MODE == "replay":
+        if _replay_index is None:
+            # Latest recording wins when a message was recorded more than once
+            _replay_index = {s["message"]: s for s in load_sessions(RECORD_PATH).values()}
+        session = _replay_index.get(message)
+        if session is None:
+            raise ReplayMiss(f"no recorded session for message: {message!r}")
+        _session.set(_Player(session, REPLAY_SPEED))
+
+
+def _mark_failed(entry: Dict[str, Any], e: BaseException) -> None:
+    if isinstance(e, Exception):
+        entry["error"] = str(e)
+        entry["error_type"] = type(e).__name__
+    else:
+        entry["cancelled"] = True
+
+
+async def _reenact_failure(entry: Dict[str, Any]) -> None:
+    """Raise a recorded error, or wait to be cancelled like the recorded call was."""
+    if "error" in entry:
+        raise RecordedError(entry["error"])
+    if entry.get("cancelled"):
+        await asyncio.Event().wait()
+
+
+class _RecordingStream:
+    """Passes an upstream stream through while capturing its chunks."""
+
+    def __init__(self, stream: Any, recorder: _Recorder, entry: Dict[str, Any]):
+        self._stream = stream
+        self._recorder = recorder
+        self._entry = entry
+        self._started = time.perf_counter()
+        self._chunks: List[Any] = []
+        self._complete = False
+        self._written = False
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        try:
+            async for chunk in self._stream:
+                self._chunks.append([round((time.perf_counter() - self._started) * 1000, 1), chunk.model_dump(exclude_unset=True)])
+                yield chunk
+        except Exception as e:
+            _mark_failed(self._entry, e)
+            raise
+        self._complete = True
+
+    async def close(self) -> None:
+        await self._stream.close()
+        if not self._written:
+            self._written = True
+            if not self._complete and "error" not in self._entry:
+                # Closed mid-stream: the run was cancelled or hit a deadline
+                self._entry["cancelled"] = True
+            self._entry["ms"] = round((time.perf_counter() - self._started) * 1000, 1)
+            self._entry["chunks"] = self._chunks
+            self._recorder.write(self._entry)
+
+
+class _ReplayStream:
+    def __init__(self, entry: Dict[str, Any], player: _Player):
+        self._entry = entry
+        self._player = player
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        from openai.types.chat import ChatCompletionChunk
+
+        started = time.perf_counter()
+        for offset_ms, data in self._entry["chunks"]:
+            wait = self._player.delay(offset_ms) - (time.perf_counter() - started)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            yield ChatCompletionChunk.model_validate(data)
+        await _reenact_failure(self._entry)
+
+    async def close(self) -> None:
+        pass
+
+
+def _completion_from_chunks(chunks: List[Any]) -> Dict[str, Any]:
+    """Fold recorded stream chunks into the equivalent ChatCompletion dict."""
+    first = chunks[0][1] if chunks else {}
+    content: List[str] = []
+    tool_calls: Dict[int, Dict[str, Any]] = {}
+    finish_reason = "stop"
+    usage = None
+    for _, chunk in chunks:
+        usage = chunk.get("usage") or usage
+        for choice in chunk.get("choices") or []:
+            delta = choice.get("delta") or {}
+            content.append(delta.get("content") or "")
+            for tc in delta.get("tool_calls") or []:
+                call = tool_calls.setdefault(tc.get("index", 0), {"id": None, "type": "function", "function": {"name": "", "arguments": ""}})
+                call["id"] = tc.get("id") or call["id"]
+                fn = tc.get("function") or {}
+                call["function"]["name"] += fn.get("name") or ""
+                call["function"]["arguments"] += fn.get("arguments") or ""
+            finish_reason = choice.get("finish_reason") or finish_reason
+    message: Dict[str, Any] = {"role": "assistant", "content": "".join(content)}
+    if tool_calls:
+        message["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)]
+    completion = {
+        "id": first.get("id", ""),
+        "object": "chat.completion",
+        "created": first.get("created", 0),
+        "model": first.get("model", ""),
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+    }
+    if usage:
+        completion["usage"] = usage
+    return completion
+
+
+def _request_key(kwargs: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(kwargs, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def _keyed_entry(key: str) -> Dict[str, Any]:
+    global _keyed_index
+    if _keyed_index is None:
+        _keyed_index = {e["key"]: e for e in read_log(RECORD_PATH) if e["k"] == "llm" and "key" in e}
+    entry = _keyed_index.get(key)
+    if entry is None:
+        raise ReplayMiss(f"no recorded response for request {key}")
+    return entry
+
+
+class _Completions:
+    def __init__(self, client: Any, by_request: bool):
+        self._client = client
+        self._by_request = by_request
+
+    async def create(self, **kwargs: Any) -> Any:
+        if self._by_request:
+            return await self._create_by_request(kwargs)
+        session = _session.get()
+        if isinstance(session, _Player):
+            return await self._replay(session, kwargs)
+        if not isinstance(session, _Recorder):
+            return await self._client.chat.completions.create(**kwargs)
+
+        entry = session.llm_entry(kwargs, session.offset_ms())
+        started = time.perf_counter()
+        try:
+            resp = await self._client.chat.completions.create(**kwargs)
+        except BaseException as e:
+            # Failed and cut-off calls are replayed too, at the same point
+            _mark_failed(entry, e)
+            entry["ms"] = round((time.perf_counter() - started) * 1000, 1)
+            session.write(entry)
+            raise
+        if kwargs.get("stream"):
+            return _RecordingStream(resp, session, entry)
+        entry["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        entry["res"] = resp.model_dump(exclude_unset=True)
+        session.write(entry)
+        return resp
+
+    async def _create_by_request(self, kwargs: Dict[str, Any]) -> Any:
+        from openai.types.chat import ChatCompletion
+
+        key = _request_key(kwargs)
+        if RECORD_MODE == "replay":
+            entry = _keyed_entry(key)
+            await asyncio.sleep(entry.get("ms", 0) / 1000.0 / REPLAY_SPEED if REPLAY_SPEED > 0 else 0.0)
+            await _reenact_failure(entry)
+            return ChatCompletion.model_validate(entry["res"])
+        entry: Dict[str, Any] = {"k": "llm", "key": key}
+        started = time.perf_counter()
+        try:
+            resp = await self._client.chat.completions.create(**kwargs)
+            entry["res"] = resp.model_dump(exclude_unset=True)
+        except BaseException as e:
+            _mark_failed(entry, e)
+            raise
+        finally:
+            entry["ms"] = round((time.perf_counter() - started) * 1000, 1)
+            _log.append(entry)
+        return resp
+
+    async def _replay(self, player: _Player, kwargs: Dict[str, Any]) -> Any:
+        from openai.types.chat import ChatCompletion
+
+        entry = player.next_llm()
+        if "chunks" in entry and kwargs.get("stream"):
+            return _ReplayStream(entry, player)
+        await asyncio.sleep(player.delay(entry.get("ms", 0)))
+        await _reenact_failure(entry)
+        if "chunks" in entry:
+            # Recorded as a stream but asked for without one (e.g. a streaming
+            # run replayed through /api/chat)
+            return ChatCompletion.model_validate(_completion_from_chunks(entry["chunks"]))
+        return ChatCompletion.model_validate(entry["res"])
+
+
+class _Chat:
+    def __init__(self, client: Any, by_request: bool):
+        self.completions = _Completions(client, by_request)
+
+
+class RecordingClient:
+    """Drop-in for an AsyncOpenAI client that records or replays chat calls."""
+
+    def __init__(self, client: Any, by_request: bool = False):
+        self.chat = _Chat(client, by_request)
+
+
+def wrap_client(client: Any, by_request: bool = False) -> Any:
+    """Wrap an AsyncOpenAI client for record/replay; a no-op when off.
+
+    By default calls belong to the current run (see `begin`). With
+    `by_request`, non-streamed calls made outside any run are recorded and
+    replayed by request content.
+    """
+    return RecordingClient(client, by_request) if RECORD_MODE in ("record", "replay") else client
+
+
+def wrap_tool(name: str, fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap a (blocking) tool function for record/replay; a no-op when off."""
+    if RECORD_MODE not in ("record", "replay"):
+        return fn
+
+    def wrapped(*args: Any) -> Any:
+        session = _session.get()
+        if isinstance(session, _Player):
+            entry = session.next_tool(name, list(args))
+            time.sleep(session.delay(entry.get("ms", 0)))
+            if "error" in entry:
+                raise RecordedError(entry["error"])
+            return entry["res"]
+        if not isinstance(session, _Recorder):
+            return fn(*args)
+        entry: Dict[str, Any] = {"k": "tool", "s": session.id, "t": session.offset_ms(), "name": name, "args": list(args)}
+        started = time.perf_counter()
+        try:
+            entry["res"] = fn(*args)
+        except Exception as e:
+            entry["error"] = str(e)
+            entry["error_type"] = type(e).__name__
+            raise
+        finally:
+            entry["ms"] = round((time.perf_counter() - started) * 1000, 1)
+            session.write(entry)
+        return entry["res"]
+
+    wrapped.__name__ = getattr(fn, "__name__", name)
+    return wrapped
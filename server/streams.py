@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Any, AsyncGenerator, Deque, Dict, Optional, Tuple
+
+from server.cancel import Cancelled, CancelScope
+
+
+# A run with no connected client is cancelled (if still working) or dropped
+# (if finished) after this many seconds, giving the client time to resume.
+RESUME_GRACE_SECONDS = float(os.getenv("STREAM_RESUME_GRACE_SECONDS", "15"))
+# Replay buffer cap per run, and for all runs together.
+RUN_BUFFER_BYTES = int(os.getenv("STREAM_RUN_BUFFER_BYTES", str(1024 * 1024)))
+TOTAL_BUFFER_BYTES = int(os.getenv("STREAM_TOTAL_BUFFER_BYTES", str(64 * 1024 * 1024)))
+
+
+class ReplayGap(Exception):
+    """The events a client asked for have already been evicted."""
+
+
+class Run:
+    """One agent run and the bounded replay buffer of the events it emitted.
+
+    Events get consecutive integer ids starting at 1. Any number of
+    connections can follow a run from a given `last_event_id`; the run
+    itself does not depend on any of them staying connected.
+    """
+
+    def __init__(self, run_id: str, max_bytes: int = RUN_BUFFER_BYTES, registry: Optional["RunRegistry"] = None):
+        self.id = run_id
+        self.scope = CancelScope()
+        self.task: Optional[asyncio.Task] = None
+        self.last_id = 0
+        self.finished = False
+        self.followers = 0
+        self.idle_since = time.monotonic()
+        self.nbytes = 0
+        self._max_bytes = max_bytes
+        self._registry = registry
+        self._buffer: Deque[Tuple[int, str]] = deque()
+        self._changed = asyncio.Event()
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        self.last_id += 1
+        data = json.dumps({"id": self.last_id, **event}, ensure_ascii=False)
+        before = self.nbytes
+        self._buffer.append((self.last_id, data))
+        self.nbytes += len(data)
+        self.trim(self.nbytes - self._max_bytes)
+        if self._registry is not None:
+            self._registry.grew(self.nbytes - before)
+        self._wake()
+
+    def trim(self, nbytes: int) -> int:
+        """Drop the oldest events (always keeping the newest) to free `nbytes`.
+
+        Returns the bytes freed. Followers that had not read the dropped
+        events yet get a ReplayGap.
+        """
+        freed = 0
+        while freed < nbytes and len(self._buffer) > 1:
+            _, dropped = self._buffer.popleft()
+            freed += len(dropped)
+        self.nbytes -= freed
+        return freed
+
+    def finish(self) -> None:
+        self.finished = True
+        self._wake()
+
+    def can_resume(self, last_event_id: int) -> bool:
+        first_id = self._buffer[0][0] if self._buffer else self.last_id + 1
+        return first_id <= last_event_id + 1
+
+    def drop_buffer(self) -> None:
+        self._buffer.clear()
+        self.nbytes = 0
+
+    def _wake(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(
+        self,
+        last_event_id: int,
+        conn: CancelScope,
+        heartbeat: Optional[float] = None,
+    ) -> AsyncGenerator[Optional[Tuple[int, str]], None]:
+        """Yield `(id, json)` for every event after `last_event_id`, live.
+
+        With `heartbeat` set, `None` is yielded whenever that many seconds
+        pass without a new event, so transports can keep proxies from idling
+        the connection out. Stops when the run has finished and everything
+        was delivered, or when `conn` is cancelled (the client went away).
+        """
+        self.followers += 1
+        cursor = last_event_id
+        try:
+            while True:
+                if not self.can_resume(cursor):
+                    raise ReplayGap(f"events after {cursor} are no longer buffered")
+                if self._buffer:
+                    start = max(0, cursor + 1 - self._buffer[0][0])
+                    for event_id, data in list(islice(self._buffer, start, None)):
+                        cursor = event_id
+                        yield event_id, data
+                    # The buffer may have grown while we were yielding
+                    if cursor < self.last_id:
+                        continue
+                if self.finished:
+                    return
+                if conn.cancelled:
+                    return
+                try:
+                    await conn.guard(asyncio.wait_for(self._changed.wait(), heartbeat))
+                except asyncio.TimeoutError:
+                    yield None
+                except Cancelled:
+                    return
+        finally:
+            self.followers -= 1
+            if not self.followers:
+                self.idle_since = time.monotonic()
+
+
+class RunRegistry:
+    """Live and recently finished runs, swept after the resume grace period.
+
+    All their replay buffers together stay under `max_bytes`, checked on
+    every publish.
+    """
+
+    def __init__(self, grace: float = RESUME_GRACE_SECONDS, max_bytes: int = TOTAL_BUFFER_BYTES):
+        self._runs: "OrderedDict[str, Run]" = OrderedDict()
+        self._grace = grace
+        self._max_bytes = max_bytes
+        self.nbytes = 0
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def create(self) -> Run:
+        run = Run(uuid.uuid4().hex, registry=self)
+        self._runs[run.id] = run
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_forever())
+        return run
+
+    def get(self, run_id: str) -> Optional[Run]:
+        return self._runs.get(run_id)
+
+    def grew(self, delta: int) -> None:
+        """Account for a run's buffer growing by `delta` bytes; enforce the cap."""
+        self.nbytes += delta
+        if self.nbytes > self._max_bytes:
+            self._enforce_cap()
+
+    def sweep(self) -> None:
+        now = time.monotonic()
+        for run in list(self._runs.values()):
+            if run.followers or now - run.idle_since < self._grace:
+                continue
+            if run.finished:
+                self._drop(run)
+            else:
+                # Nobody came back for it: stop paying for upstream work
+                run.scope.cancel("disconnected")
+
+    def _enforce_cap(self) -> None:
+        # Over the global cap: drop the oldest finished runs nobody follows,
+        # then the oldest events of the remaining runs, live ones included.
+        for run in list(self._runs.values()):
+            if self.nbytes <= self._max_bytes:
+                return
+            if run.finished and not run.followers:
+                self._drop(run)
+        for run in self._runs.values():
+            if self.nbytes <= self._max_bytes:
+                return
+            self.nbytes -= run.trim(self.nbytes - self._max_bytes)
+
+    def _drop(self, run: Run) -> None:
+        self.nbytes -= run.nbytes
+        run.drop_buffer()
+        del self._runs[run.id]
+
+    async def _sweep_forever(self) -> None:
+        while self._runs:
+            await asyncio.sleep(min(self._grace, 5.0) or 1.0)
+            self.sweep()
+
+
+runs = RunRegistry()
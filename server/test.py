@@ -2,6 +2,8 @@ import os, sys, json
 from openai import OpenAI
 from dotenv import load_dotenv
 from tools import bocha_search, get_weather, run_tool
+from prompt import MODEL, SYSTEM_PROMPT, PromptBuilder, freeze_tools
+from loop import LoopController
 
 load_dotenv()
 api_key = os.getenv("DEEPSEEK_API_KEY")
@@ -10,7 +12,7 @@ if not api_key:
 
 client = OpenAI(api_key=api_key, base_url="https://api.deepseek.com")
 
-tools = [
+tools = freeze_tools([
     {
         "type": "function",
         "function": {
@@ -62,7 +64,7 @@ tools = [
             },
         }
     },
-]
+])
 
 def parse_is_full_answer(text: str) -> bool:
     try:
@@ -80,14 +82,14 @@ def parse_is_full_answer(text: str) -> bool:
 
 def send_messages(messages):
     response = client.chat.completions.create(
-        model="deepseek-chat",
+        model=MODEL,
         messages=messages,
     )
     return response.choices[0].message
 
 def send_messages_with_tools(messages, tools):
     completion = client.chat.completions.create(
-        model="deepseek-chat",
+        model=MODEL,
         messages=messages,
         tools=tools,
         tool_choice="auto",
@@ -96,10 +98,9 @@ def send_messages_with_tools(messages, tools):
 
 def chatbot(user_prompt: str):
     user_prompt = "杭州天气怎么样" if not user_prompt else user_prompt
-    system_prompt = "You are a helpful assistant. You answer in a clear and concise way. Match your output language with user's question."
     messages = [{
         "role": "system",
-        "content": system_prompt
+        "content": SYSTEM_PROMPT
     }]
     messages.append({
         "role": "user",
@@ -116,24 +117,21 @@ def chatbot(user_prompt: str):
 
 def chatbot_with_tools(user_prompt: str):
     user_prompt = "杭州天气怎么样" if not user_prompt else user_prompt
-    # system_prompt = "You are a helpful assistant. You answer in a clear and concise way. Match your output language with user's question."
-    messages = [{
-        "role": "user",
-        "content": user_prompt
-    }]
+    prompt = PromptBuilder()
+    prompt.add_user(user_prompt)
 
     print("-" * 30)
     print("User > " + user_prompt)
 
-    # Limit rounds of tool calls to avoid infinite loop
-    for _ in range(10):
-        message = send_messages_with_tools(messages, tools)
-        messages.append({
-            "role": message.role,
-            "content": message.content,
-            # include tool_calls if present so the model can see its own call history
-            **({"tool_calls": message.tool_calls} if getattr(message, "tool_calls", None) else {}),
-        })
+    # Stop on the round cap, or once the model only repeats earlier calls
+    loop = LoopController()
+    while True:
+        stopped = loop.next_round()
+        if stopped:
+            break
+        message = send_messages_with_tools(prompt.messages, tools)
+        # include tool_calls if present so the model can see its own call history
+        prompt.add_assistant(message)
     
         tool_calls = getattr(message, "tool_calls", None)
         if not tool_calls:
@@ -150,17 +148,26 @@ def chatbot_with_tools(user_prompt: str):
             except Exception:
                 args = {}
         
-            tool_output = run_tool(fn_name, args)
+            tool_output = loop.lookup(fn_name, args)
+            if tool_output is None:
+                tool_output = run_tool(fn_name, args)
+                loop.remember(fn_name, args, str(tool_output))
 
-            messages.append({
-                "role": "tool",
-                "tool_call_id": tool_call.id,
-                "content": str(tool_output)
-            })
+            prompt.add_tool_result(tool_call.id, tool_output)
+        loop.end_round()
 
-    # Loop exits without returning
-    print("[tools] Reached max tool rounds without final content.")
-    return None
+    # Loop stopped early: ask for an answer from what we have, without tools
+    print(f"[tools] Loop stopped ({ stopped }), forcing a final answer.")
+    completion = client.chat.completions.create(
+        model=MODEL,
+        messages=prompt.messages,
+        tools=tools,
+        tool_choice="none",
+    )
+    answer = completion.choices[0].message.content
+    print("\nAssistant > ", answer)
+    check_answer(user_prompt, answer)
+    return answer
 
 def check_answer(question, answer):
     judge_prompt = """
@@ -176,7 +183,7 @@ def check_answer(question, answer):
         "content": judge_prompt
     }]
     completion = client.chat.completions.create(
-        model="deepseek-chat",
+        model=MODEL,
         messages=messages,
         response_format={ 'type': 'json_object' }
     )
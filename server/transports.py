@@ -0,0 +1,207 @@
+import os
+import json
+import asyncio
+from typing import Any, AsyncGenerator, Callable, Dict, Optional
+
+from server.cancel import CancelScope, watch_disconnect
+from server.metrics import metrics
+from server.streams import ReplayGap, Run, runs
+
+
+# Seconds of silence after which a keep-alive is written to an open stream.
+HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+
+# Frames queued for one WebSocket. Once a slow reader lets it fill up, the
+# conversations' followers wait (their events stay in the runs' bounded
+# replay buffers) instead of piling up here.
+WS_OUTBOX_FRAMES = int(os.getenv("WS_OUTBOX_FRAMES", "256"))
+
+# Headers that stop nginx & co. from buffering a streamed body.
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def ndjson_frame(event_id: Optional[int], data: Optional[str]) -> bytes:
+    # A blank line is the keep-alive; NDJSON readers skip it.
+    return (data + "\n").encode("utf-8") if data is not None else b"\n"
+
+
+def sse_frame(event_id: Optional[int], data: Optional[str]) -> bytes:
+    if data is None:
+        return b": ping\n\n"
+    # `id:` lets EventSource send Last-Event-ID when it reconnects.
+    prefix = f"id: {event_id}\n" if event_id else ""
+    return f"{prefix}data: {data}\n\n".encode("utf-8")
+
+
+async def stream_frames(
+    run: Run,
+    last_event_id: int,
+    request: Any,
+    frame: Callable[[Optional[int], Optional[str]], bytes],
+) -> AsyncGenerator[bytes, None]:
+    """Follow `run` for one HTTP response, framing each event with `frame`."""
+    conn = CancelScope(None)
+    watcher = asyncio.create_task(watch_disconnect(request, conn))
+    try:
+        async for item in run.follow(last_event_id, conn, heartbeat=HEARTBEAT_SECONDS):
+            if item is None:
+                yield frame(None, None)
+            else:
+                yield frame(*item)
+    except ReplayGap as e:
+        yield frame(None, json.dumps({"type": "error", "error": str(e)}))
+    finally:
+        watcher.cancel()
+
+
+def _tag(conversation_id: str, data: str) -> str:
+    # Splice the conversation id into the already-encoded event instead of
+    # decoding and re-encoding it for every frame.
+    return '{"conversation_id":' + json.dumps(conversation_id, ensure_ascii=False) + "," + data[1:]
+
+
+def _error(conversation_id: Optional[str], error: str) -> str:
+    return json.dumps({"type": "error", "conversation_id": conversation_id, "error": error}, ensure_ascii=False)
+
+
+class WebSocketSession:
+    """One WebSocket carrying any number of conversations.
+
+    Client -> server messages:
+      {"type": "chat", "conversation_id": "...", "message": "...", "session_id": "..."}
+      {"type": "resume", "conversation_id": "...", "run_id": "...", "last_event_id": 12}
+      {"type": "cancel", "conversation_id": "..."}
+      {"type": "ping"}
+
+    Server -> client messages are the usual stream events with a
+    `conversation_id` added, plus `{"type": "ping"}` heartbeats. Replies to
+    control messages (pongs, errors) are dropped while the outbox is full.
+    """
+
+    def __init__(self, websocket: Any, start_run: Callable[[str, Optional[str]], Run]):
+        self._ws = websocket
+        self._start_run = start_run
+        self._outbox: "asyncio.Queue[str]" = asyncio.Queue(WS_OUTBOX_FRAMES)
+        self._closed = False
+        self._follows: Dict[str, asyncio.Task] = {}
+        self._scopes: Dict[str, CancelScope] = {}
+        self._runs: Dict[str, Run] = {}
+
+    async def serve(self) -> None:
+        metrics.incr("ws_connections")
+        writer = asyncio.create_task(self._write())
+        try:
+            while True:
+                try:
+                    raw = await self._ws.receive_text()
+                except Exception:
+                    # WebSocketDisconnect, or the socket closed under us
+                    return
+                try:
+                    msg = json.loads(raw)
+                except Exception:
+                    msg = None
+                if not isinstance(msg, dict):
+                    self._reply(_error(None, "invalid message"))
+                    continue
+                self._handle(msg)
+        finally:
+            metrics.incr("ws_connections", -1)
+            writer.cancel()
+            # Stop following; the runs themselves get the usual resume grace.
+            for scope in self._scopes.values():
+                scope.cancel("disconnected")
+            for task in self._follows.values():
+                task.cancel()
+
+    def _handle(self, msg: Dict[str, Any]) -> None:
+        kind = msg.get("type")
+        conversation_id = str(msg.get("conversation_id") or "default")
+        if kind == "chat":
+            message = str(msg.get("message") or "").strip()
+            if not message:
+                self._reply(_error(conversation_id, "message required"))
+                return
+            self._follow(conversation_id, self._start_run(message, msg.get("session_id")), 0)
+        elif kind == "resume":
+            run = runs.get(str(msg.get("run_id") or ""))
+            if run is None:
+                self._reply(_error(conversation_id, "unknown run"))
+                return
+            try:
+                last_event_id = int(msg.get("last_event_id") or 0)
+            except (TypeError, ValueError):
+                self._reply(_error(conversation_id, "invalid last_event_id"))
+                return
+            metrics.incr("stream_resumes")
+            self._follow(conversation_id, run, last_event_id)
+        elif kind == "cancel":
+            self._unfollow(conversation_id)
+            run = self._runs.pop(conversation_id, None)
+            if run is not None:
+                run.scope.cancel("cancelled")
+        elif kind == "ping":
+            self._reply('{"type":"pong"}')
+        else:
+            self._reply(_error(conversation_id, f"unsupported message type: {kind}"))
+
+    def _follow(self, conversation_id: str, run: Run, last_event_id: int) -> None:
+        # A new turn on the same conversation replaces the previous follower
+        self._unfollow(conversation_id)
+        scope = CancelScope(None)
+        self._scopes[conversation_id] = scope
+        self._runs[conversation_id] = run
+        self._follows[conversation_id] = asyncio.create_task(self._forward(conversation_id, run, last_event_id, scope))
+
+    def _unfollow(self, conversation_id: str) -> None:
+        scope = self._scopes.pop(conversation_id, None)
+        if scope is not None:
+            scope.cancel("disconnected")
+        task = self._follows.pop(conversation_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def _forward(self, conversation_id: str, run: Run, last_event_id: int, scope: CancelScope) -> None:
+        try:
+            # Heartbeats are sent per socket by the writer, not per run
+            async for item in run.follow(last_event_id, scope):
+                if item is not None:
+                    await self._send(_tag(conversation_id, item[1]))
+        except ReplayGap as e:
+            # The reader fell so far behind that the run evicted its events
+            await self._send(_error(conversation_id, str(e)))
+        finally:
+            if self._scopes.get(conversation_id) is scope:
+                del self._scopes[conversation_id]
+                del self._follows[conversation_id]
+
+    async def _send(self, data: str) -> None:
+        if not self._closed:
+            await self._outbox.put(data)
+
+    def _reply(self, data: str) -> None:
+        # Control replies come from the receive loop, which must keep reading
+        # (a cancel may be next) even while a slow reader has the outbox full.
+        if self._closed:
+            return
+        try:
+            self._outbox.put_nowait(data)
+        except asyncio.QueueFull:
+            metrics.incr("ws_replies_dropped")
+
+    async def _write(self) -> None:
+        # Single writer: frames from all conversations go out in order, and a
+        # ping goes out whenever the socket has been quiet for a while.
+        while True:
+            try:
+                data = await asyncio.wait_for(self._outbox.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                data = '{"type":"ping"}'
+            try:
+                await self._ws.send_text(data)
+            except Exception:
+                break
+        # The socket is gone: keep draining so nobody waits on a full outbox
+        self._closed = True
+        while True:
+            await self._outbox.get()
@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+TOKEN_FIELDS = ("prompt_tokens", "completion_tokens", "prompt_cache_hit_tokens", "prompt_cache_miss_tokens")
+
+# Budgets for a single chat request. Either can be disabled by setting it to 0.
+MAX_REQUEST_TOKENS = int(os.getenv("MAX_REQUEST_TOKENS", "60000"))
+MAX_REQUEST_SECONDS = float(os.getenv("MAX_REQUEST_SECONDS", "60"))
+
+
+def token_field(usage: Any, name: str) -> int:
+    """`name` from an upstream `usage` object or dict, 0 if missing."""
+    value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+    return int(value or 0)
+
+
+class Usage:
+    """Token and call totals for one scope (a request, a session or a tool)."""
+
+    def __init__(self):
+        self.llm_calls = 0
+        self.tool_calls = 0
+        self.tool_output_chars = 0
+        self.tool_ms = 0.0
+        self.tokens: Dict[str, int] = {name: 0 for name in TOKEN_FIELDS}
+
+    @property
+    def total_tokens(self) -> int:
+        return self.tokens["prompt_tokens"] + self.tokens["completion_tokens"]
+
+    def add_llm(self, usage: Any) -> None:
+        self.llm_calls += 1
+        if usage is None:
+            return
+        for name in TOKEN_FIELDS:
+            self.tokens[name] += token_field(usage, name)
+
+    def add_tool(self, output: str, elapsed_ms: float) -> None:
+        self.tool_calls += 1
+        self.tool_output_chars += len(output or "")
+        self.tool_ms += elapsed_ms
+
+    def merge(self, other: "Usage") -> None:
+        self.llm_calls += other.llm_calls
+        self.tool_calls += other.tool_calls
+        self.tool_output_chars += other.tool_output_chars
+        self.tool_ms += other.tool_ms
+        for name in TOKEN_FIELDS:
+            self.tokens[name] += other.tokens[name]
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = dict(self.tokens)
+        data["total_tokens"] = self.total_tokens
+        data["llm_calls"] = self.llm_calls
+        if self.tool_calls:
+            data["tool_calls"] = self.tool_calls
+            data["tool_output_chars"] = self.tool_output_chars
+            # Tool output is fed back as prompt tokens; ~4 chars per token is
+            # close enough for attributing cost to a tool.
+            data["tool_output_tokens_est"] = self.tool_output_chars // 4
+            data["tool_ms"] = round(self.tool_ms, 1)
+        return data
+
+
+class RequestUsage:
+    """Usage of a single chat request, with a per-tool breakdown."""
+
+    def __init__(self, session_id: Optional[str] = None):
+        self.session_id = session_id
+        self.started = time.perf_counter()
+        self.total = Usage()
+        self.tools: Dict[str, Usage] = {}
+        self.stopped: Optional[str] = None
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def record_llm(self, usage: Any) -> None:
+        self.total.add_llm(usage)
+
+    def record_tool(self, name: str, output: str, elapsed_ms: float) -> None:
+        self.total.add_tool(output, elapsed_ms)
+        self.tools.setdefault(name, Usage()).add_tool(output, elapsed_ms)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "total": self.total.to_dict(),
+            "tools": {name: u.to_dict() for name, u in self.tools.items()},
+            "elapsed_ms": round(self.elapsed * 1000, 1),
+        }
+        if self.stopped:
+            data["stopped"] = self.stopped
+        return data
+
+
+class Budget:
+    """Token and wall-clock limits for one request."""
+
+    def __init__(self, max_tokens: int = MAX_REQUEST_TOKENS, max_seconds: float = MAX_REQUEST_SECONDS):
+        self.max_tokens = max_tokens
+        self.max_seconds = max_seconds
+
+    def exceeded(self, usage: RequestUsage) -> Optional[str]:
+        """Return the name of the exhausted budget, or None."""
+        if self.max_tokens and usage.total.total_tokens >= self.max_tokens:
+            return "token_budget"
+        if self.max_seconds and usage.elapsed >= self.max_seconds:
+            return "latency_budget"
+        return None
+
+    def deadline(self, usage: RequestUsage) -> Optional[float]:
+        """`time.monotonic()` time at which the latency budget runs out, if any."""
+        if not self.max_seconds:
+            return None
+        return time.monotonic() + self.max_seconds - usage.elapsed
+
+
+class UsageLedger:
+    """Per-session totals, bounded to the most recently active sessions."""
+
+    def __init__(self, max_sessions: int = 1000):
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, Usage]" = OrderedDict()
+        self._max_sessions = max_sessions
+
+    def record(self, usage: RequestUsage) -> Optional[Dict[str, Any]]:
+        if not usage.session_id:
+            return None
+        with self._lock:
+            session = self._sessions.pop(usage.session_id, None) or Usage()
+            session.merge(usage.total)
+            self._sessions[usage.session_id] = session
+            while len(self._sessions) > self._max_sessions:
+                self._sessions.popitem(last=False)
+            return session.to_dict()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session.to_dict() if session else None
+
+
+ledger = UsageLedger()
@@ -0,0 +1,201 @@
+import os
+import json
+import random
+import hashlib
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.tools import async_client
+from server import recording
+from server.metrics import metrics
+from server.prompt import MODEL
+
+
+# off      - never judge
+# sampled  - judge VERIFY_SAMPLE_RATE of the answers, after the response
+# async    - judge every answer after the response (late `verdict` event)
+# blocking - judge before `done`
+VERIFY_MODE = os.getenv("VERIFY_MODE", "off").strip().lower()
+VERIFY_SAMPLE_RATE = float(os.getenv("VERIFY_SAMPLE_RATE", "0.1"))
+# Answers are collected for up to VERIFY_BATCH_WINDOW seconds (or until
+# VERIFY_BATCH_SIZE are waiting) and judged in a single call.
+VERIFY_BATCH_SIZE = int(os.getenv("VERIFY_BATCH_SIZE", "8"))
+VERIFY_BATCH_WINDOW = float(os.getenv("VERIFY_BATCH_WINDOW", "0.2"))
+VERIFY_CACHE_SIZE = int(os.getenv("VERIFY_CACHE_SIZE", "4096"))
+
+# Judge calls batch answers from many runs, so they are recorded and
+# replayed by request rather than as part of a run (see server/recording.py).
+llm = recording.wrap_client(async_client, by_request=True)
+
+JUDGE_PROMPT = """
+You are a strict critic.
+Given the following numbered questions and answers, determine for each one if the answer is a full answer to the question.
+Your output is in json format, with one verdict per id.
+
+EXAMPLE JSON OUTPUT:
+{ "verdicts": [ { "id": 0, "is_full_answer": true }, { "id": 1, "is_full_answer": false } ] }"""
+
+
+def _as_verdict(value: Any) -> Optional[bool]:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in {"true", "yes", "1"}:
+            return True
+        if text in {"false", "no", "0"}:
+            return False
+        return None
+    if isinstance(value, (int, float)):
+        return bool(value)
+    if isinstance(value, dict):
+        return _as_verdict(value.get("is_full_answer"))
+    return None
+
+
+def parse_verdicts(text: str, count: int) -> List[Optional[bool]]:
+    """Parse a batched judge reply into `count` verdicts (None = unknown).
+
+    Accepts `{"verdicts": [{"id": 0, "is_full_answer": true}, ...]}` as asked
+    for, plus the shapes models tend to drift into: a bare list, an
+    `{"0": true}` map, or a single `{"is_full_answer": ...}` for one item.
+    """
+    verdicts: List[Optional[bool]] = [None] * count
+    try:
+        data = json.loads(text or "{}")
+    except Exception:
+        return verdicts
+    if isinstance(data, dict):
+        if "is_full_answer" in data and count == 1:
+            verdicts[0] = _as_verdict(data["is_full_answer"])
+            return verdicts
+        items = data.get("verdicts", data.get("results"))
+        if items is None:
+            items = [{"id": key, "is_full_answer": value} for key, value in data.items()]
+    else:
+        items = data
+    if not isinstance(items, list):
+        return verdicts
+    for position, item in enumerate(items):
+        index = position
+        if isinstance(item, dict) and "id" in item:
+            try:
+                index = int(item["id"])
+            except (TypeError, ValueError):
+                continue
+        if 0 <= index < count:
+            verdicts[index] = _as_verdict(item)
+    return verdicts
+
+
+def _cache_key(question: str, answer: str) -> str:
+    return hashlib.sha256(f"{question}\0{answer}".encode("utf-8")).hexdigest()
+
+
+class Verifier:
+    """LLM-as-judge for final answers, batched and cached."""
+
+    def __init__(
+        self,
+        mode: str = VERIFY_MODE,
+        sample_rate: float = VERIFY_SAMPLE_RATE,
+        batch_size: int = VERIFY_BATCH_SIZE,
+        batch_window: float = VERIFY_BATCH_WINDOW,
+        cache_size: int = VERIFY_CACHE_SIZE,
+    ):
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self._batch_size = max(1, batch_size)
+        self._batch_window = batch_window
+        self._cache: "OrderedDict[str, bool]" = OrderedDict()
+        self._cache_size = cache_size
+        self._queue: List[Tuple[str, str, str]] = []
+        self._waiting: Dict[str, "asyncio.Future[Optional[bool]]"] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._background: Set[asyncio.Task] = set()
+
+    @property
+    def blocking(self) -> bool:
+        return self.mode == "blocking"
+
+    def should_verify(self) -> bool:
+        if self.mode in ("async", "blocking"):
+            return True
+        if self.mode == "sampled":
+            return random.random() < self.sample_rate
+        return False
+
+    async def verify(self, question: str, answer: str) -> Tuple[Optional[bool], bool]:
+        """Return `(is_full_answer, cached)`; the verdict is None if the judge failed."""
+        key = _cache_key(question, answer)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            metrics.incr("verify_cache_hits")
+            return self._cache[key], True
+        # Identical pairs already waiting for a verdict share its future
+        future = self._waiting.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._waiting[key] = future
+            self._queue.append((key, question, answer))
+            if len(self._queue) >= self._batch_size:
+                self._track(asyncio.create_task(self._flush()))
+            elif self._flusher is None or self._flusher.done():
+                self._flusher = asyncio.create_task(self._flush_later())
+        return await asyncio.shield(future), False
+
+    def submit(self, question: str, answer: str) -> None:
+        """Judge in the background; the verdict only lands in metrics and the cache."""
+        self._track(asyncio.create_task(self.verify(question, answer)))
+
+    def _track(self, task: asyncio.Task) -> None:
+        # The loop only keeps weak references to tasks
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self._batch_window)
+        while self._queue:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        batch, self._queue = self._queue[:self._batch_size], self._queue[self._batch_size:]
+        if not batch:
+            return
+        try:
+            verdicts = await self._judge([(q, a) for _, q, a in batch])
+        except Exception as e:
+            print("[verify] judge failed:", repr(e))
+            verdicts = [None] * len(batch)
+        for (key, _, _), verdict in zip(batch, verdicts):
+            future = self._waiting.pop(key, None)
+            if verdict is not None:
+                self._remember(key, verdict)
+            metrics.incr("verdicts." + ("unknown" if verdict is None else "full" if verdict else "partial"))
+            if future is not None and not future.done():
+                future.set_result(verdict)
+
+    async def _judge(self, pairs: List[Tuple[str, str]]) -> List[Optional[bool]]:
+        items = [{"id": i, "question": q, "answer": a} for i, (q, a) in enumerate(pairs)]
+        judge_prompt = JUDGE_PROMPT + "\n\n" + json.dumps(items, ensure_ascii=False)
+        completion = await llm.chat.completions.create(
+            model=MODEL,
+            messages=[{"role": "user", "content": judge_prompt}],
+            response_format={"type": "json_object"},
+        )
+        metrics.incr("judge_calls")
+        metrics.observe("judge_batch_size", len(pairs))
+        # Judge tokens only go to the global totals: a batch spans several
+        # requests, and async verdicts land after their `usage` event.
+        metrics.record_usage(getattr(completion, "usage", None))
+        return parse_verdicts(completion.choices[0].message.content, len(pairs))
+
+    def _remember(self, key: str, verdict: bool) -> None:
+        self._cache[key] = verdict
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+
+verifier = Verifier()
@@ -0,0 +1,81 @@
+import os
+import sys
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app/tools.py builds its API clients at import time; they are never called.
+os.environ.setdefault("DEEPSEEK_API_KEY", "test")
+os.environ["RECORD_MODE"] = "off"
+os.environ["VERIFY_MODE"] = "off"
+
+
+def tool_call(name: str, arguments: str, call_id: str = "call_0") -> SimpleNamespace:
+    return SimpleNamespace(id=call_id, type="function", function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def completion(content: Any = None, tool_calls: Any = None) -> SimpleNamespace:
+    message = SimpleNamespace(role="assistant", content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+class Upstreams:
+    """Stand-ins for DeepSeek and get_weather that count their calls.
+
+    The LLM asks for `get_weather` until a tool result is in the prompt, then
+    answers. The tool blocks for `tool_seconds`; tool rounds (not the final
+    answer) take `llm_seconds`.
+    """
+
+    def __init__(self):
+        self.llm_calls: List[Dict[str, Any]] = []
+        self.tool_calls: List[str] = []
+        self.tool_started = threading.Event()
+        self.tool_seconds = 1.0
+        self.llm_seconds = 0.0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs: Any) -> Any:
+        import asyncio
+
+        self.llm_calls.append(kwargs)
+        if self.llm_seconds and kwargs.get("tool_choice") != "none":
+            await asyncio.sleep(self.llm_seconds)
+        if kwargs.get("tool_choice") != "none" and not any(m["role"] == "tool" for m in kwargs["messages"]):
+            return completion(tool_calls=[tool_call("get_weather", '{"location": "Hangzhou"}')])
+        if kwargs.get("stream"):
+            return _Stream("Sunny.")
+        return completion(content="Sunny.")
+
+    def get_weather(self, location: str) -> str:
+        import time
+
+        self.tool_calls.append(location)
+        self.tool_started.set()
+        time.sleep(self.tool_seconds)
+        return "24 degrees"
+
+
+class _Stream:
+    def __init__(self, text: str):
+        self._text = text
+
+    async def __aiter__(self):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=self._text))], usage=None)
+
+    async def close(self) -> None:
+        pass
+
+
+@pytest.fixture
+def upstreams(monkeypatch: pytest.MonkeyPatch) -> Upstreams:
+    import server.agent as agent
+
+    stub = Upstreams()
+    monkeypatch.setattr(agent, "llm", stub)
+    monkeypatch.setitem(agent.TOOL_FUNCTIONS, "get_weather", stub.get_weather)
+    return stub
@@ -0,0 +1,59 @@
+import asyncio
+import functools
+
+import pytest
+
+import server.agent as agent
+from server.agent import DEADLINE_RESULT, run_agent
+from server.cancel import CancelScope
+from server.loop import LoopController
+from server.usage import Budget, RequestUsage
+
+
+@pytest.fixture
+def short_deadline(monkeypatch):
+    # 1.5s per request, 0.5s of it kept for the final answer
+    monkeypatch.setattr(agent, "LoopController", functools.partial(LoopController, reserve=0.5))
+    return lambda: CancelScope(1.5)
+
+
+def _run(scope, stream=True):
+    usage = RequestUsage()
+
+    async def collect():
+        return [event async for event in run_agent("Weather in Hangzhou?", usage=usage, budget=Budget(), scope=scope, stream=stream)]
+
+    return asyncio.run(collect()), usage
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_slow_tool_is_cut_off_and_the_run_still_answers(upstreams, short_deadline, stream):
+    upstreams.tool_seconds = 2.0
+    events, usage = _run(short_deadline(), stream)
+
+    assert usage.stopped == "deadline"
+    assert {"type": "tool_result", "name": "get_weather", "result": DEADLINE_RESULT} in events
+    assert events[-1] == {"type": "content_delta", "text": "Sunny."}
+    final = upstreams.llm_calls[-1]
+    assert final["tool_choice"] == "none"
+    # The cut-off call still gets a tool message, so the request is valid
+    assert final["messages"][-1] == {"role": "tool", "tool_call_id": "call_0", "content": DEADLINE_RESULT}
+
+
+def test_slow_llm_round_is_cut_off_and_the_run_still_answers(upstreams, short_deadline):
+    upstreams.llm_seconds = 2.0
+    events, usage = _run(short_deadline())
+
+    assert usage.stopped == "deadline"
+    assert upstreams.tool_calls == []
+    assert [e["type"] for e in events] == ["content_delta"]
+    assert [c["tool_choice"] for c in upstreams.llm_calls] == ["auto", "none"]
+
+
+def test_fast_run_is_not_affected(upstreams, short_deadline):
+    upstreams.tool_seconds = 0.0
+    events, usage = _run(short_deadline())
+
+    assert usage.stopped is None
+    assert {"type": "tool_result", "name": "get_weather", "result": "24 degrees"} in events
+    assert events[-1] == {"type": "content_delta", "text": "Sunny."}
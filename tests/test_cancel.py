@@ -0,0 +1,138 @@
+import asyncio
+import functools
+
+import pytest
+
+import server.agent as agent
+import server.main as main
+from server.agent import DEADLINE_RESULT, run_agent
+from server.cancel import Cancelled, CancelScope
+from server.loop import LoopController
+from server.streams import RunRegistry
+from server.usage import Budget, RequestUsage
+
+
+async def _wait_for(flag, timeout: float = 5.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not flag.is_set():
+        assert asyncio.get_running_loop().time() < deadline, "timed out waiting for the tool to start"
+        await asyncio.sleep(0.01)
+
+
+def test_cancel_during_tool_stops_upstream_calls(upstreams):
+    upstreams.tool_seconds = 0.5
+
+    async def scenario():
+        scope = CancelScope()
+
+        async def consume():
+            async for _ in run_agent("Weather in Hangzhou?", usage=RequestUsage(), budget=Budget(), scope=scope):
+                pass
+
+        task = asyncio.create_task(consume())
+        await _wait_for(upstreams.tool_started)
+        scope.cancel("disconnected")
+        with pytest.raises(Cancelled):
+            await asyncio.wait_for(task, 1.0)
+        # Give the abandoned tool thread time to return; its result must go nowhere
+        await asyncio.sleep(upstreams.tool_seconds + 0.2)
+
+    asyncio.run(scenario())
+    assert len(upstreams.llm_calls) == 1
+    assert upstreams.tool_calls == ["Hangzhou"]
+
+
+def test_cancel_before_start_makes_no_calls(upstreams):
+    async def scenario():
+        scope = CancelScope()
+        scope.cancel("disconnected")
+        with pytest.raises(Cancelled):
+            async for _ in run_agent("Weather in Hangzhou?", usage=RequestUsage(), budget=Budget(), scope=scope):
+                pass
+
+    asyncio.run(scenario())
+    assert upstreams.llm_calls == []
+    assert upstreams.tool_calls == []
+
+
+def test_stream_run_cancelled_only_after_grace(upstreams, monkeypatch):
+    grace = 0.2
+    upstreams.tool_seconds = 1.5
+
+    async def scenario():
+        registry = RunRegistry(grace=grace)
+        monkeypatch.setattr(main, "runs", registry)
+        run = main._start_run("Weather in Hangzhou?")
+
+        # A client follows the run for a moment, then drops the connection
+        conn = CancelScope(None)
+        async for item in run.follow(0, conn):
+            conn.cancel("disconnected")
+        await _wait_for(upstreams.tool_started)
+
+        # Within the grace period the run keeps going, so the client could resume
+        await asyncio.sleep(grace / 2)
+        assert not run.scope.cancelled
+        assert registry.get(run.id) is run
+
+        # Nobody came back: the sweep cancels it and no further call is made
+        await asyncio.sleep(grace * 3)
+        assert run.scope.reason == "disconnected"
+        await asyncio.wait_for(run.task, 1.0)
+        assert run.finished
+        await asyncio.sleep(upstreams.tool_seconds)
+
+    asyncio.run(scenario())
+    assert len(upstreams.llm_calls) == 1
+    assert upstreams.tool_calls == ["Hangzhou"]
+
+
+def _queued_behind_a_busy_slot(monkeypatch):
+    # One tool slot, held by someone else for the whole test
+    slots = asyncio.Semaphore(1)
+    monkeypatch.setattr(agent, "_tool_slots", slots)
+    return slots
+
+
+def test_disconnect_while_waiting_for_a_tool_slot(upstreams, monkeypatch):
+    async def scenario():
+        slots = _queued_behind_a_busy_slot(monkeypatch)
+        await slots.acquire()
+        scope = CancelScope()
+
+        async def consume():
+            async for _ in run_agent("Weather in Hangzhou?", usage=RequestUsage(), budget=Budget(), scope=scope):
+                pass
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.1)
+        scope.cancel("disconnected")
+        with pytest.raises(Cancelled):
+            await asyncio.wait_for(task, 0.5)
+        # The abandoned wait must not have taken (or leaked) the slot
+        slots.release()
+        assert not slots.locked()
+
+    asyncio.run(scenario())
+    assert upstreams.tool_calls == []
+    assert len(upstreams.llm_calls) == 1
+
+
+def test_deadline_while_waiting_for_a_tool_slot_still_answers(upstreams, monkeypatch):
+    monkeypatch.setattr(agent, "LoopController", functools.partial(LoopController, reserve=0.5))
+
+    async def scenario():
+        slots = _queued_behind_a_busy_slot(monkeypatch)
+        await slots.acquire()
+        usage = RequestUsage()
+
+        async def collect():
+            return [e async for e in run_agent("Weather in Hangzhou?", usage=usage, budget=Budget(), scope=CancelScope(1.5))]
+
+        return usage, await asyncio.wait_for(collect(), 5.0)
+
+    usage, events = asyncio.run(scenario())
+    assert usage.stopped == "deadline"
+    assert {"type": "tool_result", "name": "get_weather", "result": DEADLINE_RESULT} in events
+    assert events[-1] == {"type": "content_delta", "text": "Sunny."}
+    assert upstreams.tool_calls == []
@@ -0,0 +1,66 @@
+import time
+
+from server.loop import LoopController
+
+
+def _controller_with(name, args, result="cached"):
+    loop = LoopController()
+    loop.remember(name, args, result)
+    return loop
+
+
+def test_repeated_text_matches_up_to_case_whitespace_and_word_order():
+    loop = _controller_with("bocha_search", {"query": "latest stock price of Apple Inc on Nasdaq today"})
+    assert loop.lookup("bocha_search", {"query": "Latest  stock price of Apple Inc on Nasdaq today?"}) == "cached"
+    assert loop.lookup("bocha_search", {"query": "Apple Inc latest stock price on Nasdaq today of"}) == "cached"
+    assert loop.duplicates == 2
+
+
+def test_text_with_a_different_term_is_not_a_duplicate():
+    loop = _controller_with("bocha_search", {"query": "latest stock price of Apple Inc on Nasdaq today"})
+    assert loop.lookup("bocha_search", {"query": "latest stock price of Microsoft Inc on Nasdaq today"}) is None
+    assert loop.lookup("bocha_search", {"query": "latest stock price of Apple Inc on Nasdaq"}) is None
+    assert loop.lookup("bocha_search", {"query": "杭州天气"}) is None
+    assert loop.duplicates == 0
+
+
+def test_urls_match_exactly_except_scheme_host_case_and_fragment():
+    url = "https://docs.python.org/3/library/asyncio-task.html"
+    loop = _controller_with("fetch", {"url": url})
+    assert loop.lookup("fetch", {"url": "HTTPS://Docs.Python.org/3/library/asyncio-task.html#coroutines"}) == "cached"
+    assert loop.lookup("fetch", {"url": "https://docs.python.org/3/library/asyncio-stream.html"}) is None
+    assert loop.lookup("fetch", {"url": url + "?x=1"}) is None
+
+
+def test_url_paths_are_case_sensitive():
+    loop = _controller_with("fetch", {"url": "https://github.com/Foo/Bar/blob/main/README.md"})
+    assert loop.lookup("fetch", {"url": "https://github.com/foo/bar/blob/main/readme.md"}) is None
+
+
+def test_other_tools_and_argument_sets_never_match():
+    loop = _controller_with("bocha_search", {"query": "hangzhou weather"})
+    assert loop.lookup("get_weather", {"query": "hangzhou weather"}) is None
+    assert loop.lookup("bocha_search", {"query": "hangzhou weather", "count": 5}) is None
+
+
+def test_stops_after_a_round_of_only_repeats():
+    loop = LoopController(max_rounds=5)
+    assert loop.next_round() is None
+    loop.remember("bocha_search", {"query": "hangzhou weather"}, "r")
+    loop.end_round()
+    assert loop.next_round() is None
+    loop.lookup("bocha_search", {"query": "Hangzhou weather"})
+    loop.end_round()
+    assert loop.next_round() == "no_progress"
+
+
+def test_stops_at_round_cap_and_before_the_deadline_reserve():
+    loop = LoopController(max_rounds=1)
+    assert loop.next_round() is None
+    loop.remember("get_weather", {"location": "Hangzhou"}, "r")
+    loop.end_round()
+    assert loop.next_round() == "max_rounds"
+
+    loop = LoopController(deadline=time.monotonic() + 5, reserve=10)
+    assert loop.next_round() == "deadline"
+    assert loop.round_deadline() < time.monotonic()
@@ -0,0 +1,54 @@
+from server.pages import FETCH_STAGES, MAX_PAGE_TOKENS, chunk, count_tokens, select_relevant
+
+
+def _postprocess(text, query):
+    for stage in FETCH_STAGES:
+        text = stage(text, {"query": query})
+    return text
+
+
+def _table_page(rows):
+    header = "| city | date | weather | high | low |\n|---|---|---|---|---|\n"
+    return header + "\n".join(f"| city{i} | 2024-07-{i % 28 + 1:02d} | cloudy | {20 + i % 10} | {15 + i % 5} |" for i in range(rows))
+
+
+def test_table_without_blank_lines_keeps_relevant_rows():
+    page = _table_page(400).replace("| city123 |", "| Hangzhou |")
+    assert count_tokens(page) > 3 * MAX_PAGE_TOKENS
+
+    result = _postprocess(page, "Hangzhou weather")
+    assert result
+    assert count_tokens(result) <= MAX_PAGE_TOKENS
+    assert "| Hangzhou |" in result
+
+
+def test_single_line_without_sentence_breaks_is_windowed():
+    page = " ".join(f"word{i}" for i in range(5000))
+    result = _postprocess(page, "word4321")
+    assert result
+    assert count_tokens(result) <= MAX_PAGE_TOKENS
+    assert "word4321" in result
+
+
+def test_long_cjk_text_without_newlines():
+    page = "杭州今天多云，气温二十四度。" * 400
+    result = _postprocess(page, "杭州天气")
+    assert result
+    assert count_tokens(result) <= MAX_PAGE_TOKENS
+
+
+def test_chunks_respect_the_limit_and_keep_all_text():
+    page = "intro paragraph.\n\n" + _table_page(100) + "\n\nlast paragraph."
+    chunks = chunk(page, 50)
+    assert all(count_tokens(c) <= 50 for c in chunks)
+    assert "".join("".join(chunks).split()) == "".join(page.split())
+
+
+def test_small_budget_falls_back_to_truncation():
+    page = "one two three four five six seven eight nine ten"
+    assert select_relevant(page, {"query": "seven", "max_tokens": 3})
+    assert count_tokens(select_relevant(page, {"query": "seven", "max_tokens": 3})) <= 3
+
+
+def test_short_page_is_returned_unchanged():
+    assert select_relevant("short page", {"query": "anything"}) == "short page"
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+from typing import Any, List
+
+import pytest
+
+import server.agent as agent
+from conftest import completion, tool_call
+from server.agent import run_agent
+from server.prompt import freeze_tools
+from server.usage import Budget, RequestUsage
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class PrefixLLM:
+    """Asks for the weather in each of `cities`, one round each, then answers.
+
+    Every request is serialized when it is made: the agent keeps appending to
+    the same message list, so holding on to it would hide rewrites.
+    """
+
+    def __init__(self, cities: List[str]):
+        self.cities = cities
+        self.messages: List[str] = []
+        self.tools: List[str] = []
+
+    async def create(self, **kwargs: Any) -> Any:
+        self.messages.append(json.dumps(kwargs["messages"], ensure_ascii=False))
+        self.tools.append(json.dumps(kwargs["tools"], ensure_ascii=False))
+        rounds = sum(1 for m in kwargs["messages"] if m["role"] == "tool")
+        if kwargs.get("tool_choice") != "none" and rounds < len(self.cities):
+            arguments = json.dumps({"location": self.cities[rounds]})
+            return completion(tool_calls=[tool_call("get_weather", arguments, f"call_{rounds}")])
+        return completion(content="Sunny.")
+
+
+@pytest.fixture
+def prefix_llm(upstreams, monkeypatch):
+    upstreams.tool_seconds = 0.0
+    stub = PrefixLLM(["Hangzhou", "Beijing", "Shanghai"])
+    monkeypatch.setattr(upstreams.chat.completions, "create", stub.create)
+    return stub
+
+
+def _ask(message: str) -> None:
+    async def collect():
+        return [e async for e in run_agent(message, usage=RequestUsage(), budget=Budget(), stream=False)]
+
+    asyncio.run(collect())
+
+
+def test_each_round_extends_the_previous_prompt(prefix_llm):
+    _ask("Weather in Hangzhou, Beijing and Shanghai?")
+
+    # Three tool rounds, the round that answers, and nothing else
+    assert len(prefix_llm.messages) == 4
+    for earlier, later in zip(prefix_llm.messages, prefix_llm.messages[1:]):
+        before, after = json.loads(earlier), json.loads(later)
+        assert len(after) > len(before)
+        assert after[:len(before)] == before
+        # Byte for byte, up to the closing bracket of the shorter list
+        assert later.startswith(earlier[:-1])
+
+
+def test_tool_schema_bytes_are_identical_across_requests(prefix_llm):
+    _ask("Weather in Hangzhou?")
+    _ask("Weather in Beijing, please")
+
+    assert len(set(prefix_llm.tools)) == 1
+    assert prefix_llm.tools[0] == json.dumps(agent.TOOLS, ensure_ascii=False)
+    # The system prompt leads every request the same way too
+    assert len({json.dumps(json.loads(m)[0]) for m in prefix_llm.messages}) == 1
+
+
+def test_tool_schema_bytes_are_identical_across_imports():
+    script = "import json, server.agent as a; print(json.dumps(a.TOOLS, ensure_ascii=False))"
+    outputs = set()
+    for seed in ("0", "1", "12345"):
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        outputs.add(subprocess.run(
+            [sys.executable, "-c", script], cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+        ).stdout.strip())
+    assert outputs == {json.dumps(agent.TOOLS, ensure_ascii=False)}
+
+
+def test_freeze_tools_ignores_key_order():
+    a = [{"type": "function", "function": {"name": "f", "parameters": {"type": "object", "properties": {}}}}]
+    b = [{"function": {"parameters": {"properties": {}, "type": "object"}, "name": "f"}, "type": "function"}]
+    assert json.dumps(freeze_tools(a)) == json.dumps(freeze_tools(b))
@@ -0,0 +1,202 @@
+import asyncio
+import functools
+
+import pytest
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+import server.agent as agent
+import server.verify as verify
+from server import recording
+from server.cancel import CancelScope
+from server.loop import LoopController
+from server.usage import Budget, RequestUsage
+
+USAGE = {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12}
+WEATHER_CALL = {"id": "call_0", "type": "function", "function": {"name": "get_weather", "arguments": '{"location": "Hangzhou"}'}}
+SEARCH_CALL = {"id": "call_0", "type": "function", "function": {"name": "bocha_search", "arguments": '{"query": "Hangzhou weather"}'}}
+
+
+def _completion(message):
+    return ChatCompletion.model_validate({
+        "id": "c", "object": "chat.completion", "created": 0, "model": "m",
+        "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+        "usage": USAGE,
+    })
+
+
+class _Stream:
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    async def __aiter__(self):
+        for chunk in self._chunks:
+            yield chunk
+
+    async def close(self):
+        pass
+
+
+class LiveLLM:
+    """Answers like DeepSeek would, with real openai response types."""
+
+    def __init__(self, tool_call=WEATHER_CALL, round_seconds=0.0, round_error=None):
+        self.calls = 0
+        self.tool_call = tool_call
+        self.round_seconds = round_seconds
+        self.round_error = round_error
+        self.chat = type("Chat", (), {"completions": self})()
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        if kwargs.get("tool_choice") == "auto":
+            await asyncio.sleep(self.round_seconds)
+            if self.round_error:
+                raise self.round_error
+        if kwargs.get("stream"):
+            chunks = [
+                {"id": "s", "object": "chat.completion.chunk", "created": 0, "model": "m",
+                 "choices": [{"index": 0, "delta": {"role": "assistant", "content": text}, "finish_reason": None}]}
+                for text in ("It is ", "24 degrees.")
+            ]
+            chunks.append({"id": "s", "object": "chat.completion.chunk", "created": 0, "model": "m", "choices": [], "usage": USAGE})
+            return _Stream([ChatCompletionChunk.model_validate(c) for c in chunks])
+        if kwargs.get("tool_choice") == "none":
+            return _completion({"role": "assistant", "content": "It is 24 degrees."})
+        return _completion({"role": "assistant", "content": None, "tool_calls": [self.tool_call]})
+
+
+class Unreachable:
+    def __init__(self):
+        self.chat = type("Chat", (), {"completions": self})()
+
+    async def create(self, **kwargs):
+        raise AssertionError("replay went to the live upstream")
+
+
+@pytest.fixture
+def log_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "recordings.jsonl")
+    monkeypatch.setattr(recording, "RECORD_PATH", path)
+    monkeypatch.setattr(recording, "REPLAY_SPEED", 0.0)
+    monkeypatch.setattr(recording, "_replay_index", None)
+    # One tool round, then the forced final answer
+    monkeypatch.setattr(agent, "LoopController", functools.partial(LoopController, max_rounds=1))
+    return path
+
+
+def _use(monkeypatch, mode, path, client, weather=None, search=None):
+    monkeypatch.setattr(recording, "RECORD_MODE", mode)
+    monkeypatch.setattr(recording, "_log", recording._Log(path) if mode == "record" else None)
+    monkeypatch.setattr(recording, "_replay_index", None)
+    monkeypatch.setattr(recording, "_keyed_index", None)
+    monkeypatch.setattr(agent, "llm", recording.wrap_client(client))
+    monkeypatch.setattr(verify, "llm", recording.wrap_client(client, by_request=True))
+    for name, fn in (("get_weather", weather), ("bocha_search", search)):
+        monkeypatch.setitem(agent.TOOL_FUNCTIONS, name, recording.wrap_tool(name, fn or _fail))
+
+
+def _answer(stream, scope=None, usage=None):
+    async def run():
+        return [e async for e in agent.run_agent(
+            "Weather in Hangzhou?", usage=usage or RequestUsage(), budget=Budget(), scope=scope, stream=stream,
+        )]
+
+    events = asyncio.run(run())
+    return "".join(e["text"] for e in events if e["type"] == "content_delta"), events
+
+
+def _fail(*args):
+    raise AssertionError("replay called the live tool")
+
+
+def test_stream_recording_replays_on_both_endpoints(log_path, monkeypatch):
+    live = LiveLLM()
+    _use(monkeypatch, "record", log_path, live, lambda location: "24 degrees")
+    recorded, _ = _answer(stream=True)
+    assert recorded == "It is 24 degrees."
+
+    session, = recording.load_sessions(log_path).values()
+    assert session["stream"] is True
+    assert [("chunks" in e) for e in session["entries"] if e["k"] == "llm"] == [False, True]
+
+    for stream in (True, False):
+        _use(monkeypatch, "replay", log_path, Unreachable())
+        replayed, events = _answer(stream=stream)
+        assert replayed == recorded
+        assert {"type": "tool_result", "name": "get_weather", "result": "24 degrees"} in events
+    assert live.calls == 2
+
+
+def test_tool_errors_are_recorded_and_raised_again_on_replay(log_path, monkeypatch):
+    def search(query):
+        raise RuntimeError("502 Server Error: Bad Gateway")
+
+    _use(monkeypatch, "record", log_path, LiveLLM(SEARCH_CALL), search=search)
+    _, recorded = _answer(stream=True)
+    failed = {"type": "tool_result", "name": "bocha_search", "result": '{"error": "502 Server Error: Bad Gateway"}'}
+    assert failed in recorded
+
+    tool_entry, = [e for e in recording.read_log(log_path) if e["k"] == "tool"]
+    assert tool_entry["error_type"] == "RuntimeError"
+
+    _use(monkeypatch, "replay", log_path, Unreachable())
+    _, replayed = _answer(stream=True)
+    assert replayed == recorded
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_llm_call_cut_off_by_the_deadline_replays_the_same_way(log_path, monkeypatch, stream):
+    # The tool round overruns the round deadline (1.5s - 0.5s reserve)
+    monkeypatch.setattr(agent, "LoopController", functools.partial(LoopController, reserve=0.5))
+    live = LiveLLM(round_seconds=3.0)
+    _use(monkeypatch, "record", log_path, live)
+    usage = RequestUsage()
+    recorded, _ = _answer(stream, CancelScope(1.5), usage)
+    assert usage.stopped == "deadline"
+    assert recorded == "It is 24 degrees."
+
+    llm_entries = [e for e in recording.read_log(log_path) if e["k"] == "llm"]
+    assert len(llm_entries) == live.calls == 2
+    assert llm_entries[0]["cancelled"] is True
+    recorded_calls = usage.total.llm_calls
+
+    _use(monkeypatch, "replay", log_path, Unreachable())
+    usage = RequestUsage()
+    replayed, _ = _answer(stream, CancelScope(1.5), usage)
+    assert replayed == recorded
+    assert usage.stopped == "deadline"
+    assert usage.total.llm_calls == recorded_calls
+
+
+def test_llm_errors_are_recorded_and_raised_again_on_replay(log_path, monkeypatch):
+    _use(monkeypatch, "record", log_path, LiveLLM(round_error=RuntimeError("503 Service Unavailable")))
+    with pytest.raises(RuntimeError, match="503"):
+        _answer(stream=True)
+
+    _use(monkeypatch, "replay", log_path, Unreachable())
+    with pytest.raises(recording.RecordedError, match="503 Service Unavailable"):
+        _answer(stream=True)
+
+
+class JudgeLLM:
+    def __init__(self):
+        self.chat = type("Chat", (), {"completions": self})()
+
+    async def create(self, **kwargs):
+        return _completion({"role": "assistant", "content": '{"verdicts": [{"id": 0, "is_full_answer": true}]}'})
+
+
+def test_judge_calls_are_recorded_and_replayed_by_request(log_path, monkeypatch):
+    def judge():
+        verifier = verify.Verifier(mode="blocking", batch_window=0.0)
+        return asyncio.run(verifier.verify("Weather in Hangzhou?", "It is 24 degrees."))
+
+    _use(monkeypatch, "record", log_path, JudgeLLM())
+    assert judge() == (True, False)
+
+    _use(monkeypatch, "replay", log_path, Unreachable())
+    assert judge() == (True, False)
+
+    # A request that was never recorded does not go to the live judge either
+    verifier = verify.Verifier(mode="blocking", batch_window=0.0)
+    assert asyncio.run(verifier.verify("Weather in Beijing?", "Sunny.")) == (None, False)
@@ -0,0 +1,42 @@
+import pytest
+from starlette.testclient import TestClient
+
+import server.main as main
+from server.streams import RunRegistry
+
+
+@pytest.fixture
+def client(upstreams, monkeypatch):
+    upstreams.tool_seconds = 0.0
+    monkeypatch.setattr(main, "runs", RunRegistry())
+    with TestClient(main.app) as client:
+        yield client
+
+
+def _events(resp):
+    return [line[len("data: "):] for line in resp.text.splitlines() if line.startswith("data: ")]
+
+
+def test_eventsource_reconnect_does_not_start_a_second_run(client, upstreams):
+    resp = client.get("/api/chat/sse", params={"message": "Weather in Hangzhou?"})
+    assert resp.status_code == 200
+    assert '"type": "done"' in resp.text
+    llm_calls = len(upstreams.llm_calls)
+
+    # What EventSource does once the server closes the stream
+    again = client.get("/api/chat/sse", params={"message": "Weather in Hangzhou?"}, headers={"Last-Event-ID": "7"})
+    assert again.status_code == 204
+    assert len(upstreams.llm_calls) == llm_calls
+
+
+def test_resume_of_a_fully_delivered_run_ends_the_eventsource(client):
+    resp = client.get("/api/chat/sse", params={"message": "Weather in Hangzhou?"})
+    run_id = resp.headers["x-run-id"]
+    last_id = int([line for line in resp.text.splitlines() if line.startswith("id: ")][-1][4:])
+
+    partial = client.get("/api/chat/sse", params={"run_id": run_id}, headers={"Last-Event-ID": "1"})
+    assert partial.status_code == 200
+    assert len(_events(partial)) == last_id - 1
+
+    done = client.get("/api/chat/sse", params={"run_id": run_id}, headers={"Last-Event-ID": str(last_id)})
+    assert done.status_code == 204
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import time
+
+import pytest
+from starlette.testclient import TestClient
+
+import server.main as main
+from server.cancel import CancelScope
+from server.streams import ReplayGap, RunRegistry
+
+
+def _lines(resp):
+    return [json.loads(line) for line in resp.text.splitlines() if line.strip()]
+
+
+def test_global_cap_trims_live_runs():
+    async def scenario():
+        registry = RunRegistry(max_bytes=2000)
+        first, second = registry.create(), registry.create()
+        for i in range(50):
+            first.publish({"type": "content_delta", "text": f"first {i} " * 3})
+            second.publish({"type": "content_delta", "text": f"second {i} " * 3})
+        assert registry.nbytes == first.nbytes + second.nbytes
+        assert registry.nbytes <= 2000
+        # Both runs are live and keep their newest events
+        assert first.can_resume(first.last_id - 1) and second.can_resume(second.last_id - 1)
+
+        # A follower that had fallen behind gets a gap instead of silently missing events
+        assert not first.can_resume(0)
+        with pytest.raises(ReplayGap):
+            async for _ in first.follow(0, CancelScope(None)):
+                pass
+
+    asyncio.run(scenario())
+
+
+def test_finished_runs_are_dropped_before_live_events():
+    async def scenario():
+        registry = RunRegistry(max_bytes=3000)
+        done = registry.create()
+        done.publish({"type": "content_delta", "text": "x" * 1000})
+        done.finish()
+        live = registry.create()
+        for i in range(4):
+            live.publish({"type": "content_delta", "text": "y" * 600})
+        assert registry.get(done.id) is None
+        assert live.can_resume(0)
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def registry(upstreams, monkeypatch):
+    upstreams.tool_seconds = 0.0
+    registry = RunRegistry(grace=0.2)
+    monkeypatch.setattr(main, "runs", registry)
+    return registry
+
+
+def test_post_resume_replays_after_last_event_id(registry):
+    with TestClient(main.app) as client:
+        resp = client.post("/api/chat/stream", json={"message": "Weather in Hangzhou?"})
+        events = _lines(resp)
+        assert events[-1]["type"] == "done"
+        run_id = resp.headers["x-run-id"]
+
+        resumed = client.post("/api/chat/stream", json={"run_id": run_id, "last_event_id": 2})
+        assert resumed.status_code == 200
+        assert _lines(resumed) == events[2:]
+
+
+def test_resume_of_unknown_run_is_404(registry):
+    with TestClient(main.app) as client:
+        resp = client.post("/api/chat/stream", json={"run_id": "nope", "last_event_id": 0})
+        assert resp.status_code == 404
+
+
+def test_resume_of_evicted_events_is_410(registry):
+    with TestClient(main.app) as client:
+        resp = client.post("/api/chat/stream", json={"message": "Weather in Hangzhou?"})
+        run = registry.get(resp.headers["x-run-id"])
+        run.trim(run.nbytes)
+
+        gone = client.post("/api/chat/stream", json={"run_id": run.id, "last_event_id": 0})
+        assert gone.status_code == 410
+        latest = client.post("/api/chat/stream", json={"run_id": run.id, "last_event_id": run.last_id - 1})
+        assert latest.status_code == 200
+
+
+def test_finished_run_is_dropped_after_the_grace_period(registry):
+    with TestClient(main.app) as client:
+        resp = client.post("/api/chat/stream", json={"message": "Weather in Hangzhou?"})
+        run_id = resp.headers["x-run-id"]
+        assert client.post("/api/chat/stream", json={"run_id": run_id, "last_event_id": 0}).status_code == 200
+
+        time.sleep(0.6)
+        assert registry.get(run_id) is None
+        assert registry.nbytes == 0
+        assert client.post("/api/chat/stream", json={"run_id": run_id, "last_event_id": 0}).status_code == 404
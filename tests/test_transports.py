@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+import server.transports as transports
+from server.streams import Run
+from server.transports import WebSocketSession
+
+
+class SlowSocket:
+    """A WebSocket whose client stops reading until `reading` is set."""
+
+    def __init__(self):
+        self.incoming: "asyncio.Queue" = asyncio.Queue()
+        self.sent = []
+        self.reading = asyncio.Event()
+
+    async def receive_text(self) -> str:
+        msg = await self.incoming.get()
+        if msg is None:
+            raise RuntimeError("disconnected")
+        return msg
+
+    async def send_text(self, data: str) -> None:
+        await self.reading.wait()
+        self.sent.append(json.loads(data))
+
+
+def test_slow_websocket_reader_gets_backpressure_not_an_unbounded_outbox(monkeypatch):
+    monkeypatch.setattr(transports, "WS_OUTBOX_FRAMES", 8)
+
+    async def scenario():
+        run = Run("r1")
+        ws = SlowSocket()
+        session = WebSocketSession(ws, lambda message, session_id: run)
+        serving = asyncio.create_task(session.serve())
+        for i in range(500):
+            run.publish({"type": "content_delta", "text": f"token{i} "})
+        await ws.incoming.put(json.dumps({"type": "chat", "conversation_id": "c1", "message": "hi"}))
+        await asyncio.sleep(0.2)
+        assert session._outbox.qsize() <= 8
+        assert ws.sent == []
+
+        # The reader catches up: nothing was lost or reordered
+        run.publish({"type": "done"})
+        run.finish()
+        ws.reading.set()
+        while not ws.sent or ws.sent[-1]["type"] != "done":
+            await asyncio.sleep(0.01)
+        assert [e["id"] for e in ws.sent] == list(range(1, 502))
+        assert all(e["conversation_id"] == "c1" for e in ws.sent)
+
+        await ws.incoming.put(None)
+        await asyncio.wait_for(serving, 1.0)
+
+    asyncio.run(scenario())
+
+
+def test_control_messages_are_handled_while_the_outbox_is_full(monkeypatch):
+    monkeypatch.setattr(transports, "WS_OUTBOX_FRAMES", 8)
+
+    async def scenario():
+        run = Run("r1")
+        ws = SlowSocket()
+        session = WebSocketSession(ws, lambda message, session_id: run)
+        serving = asyncio.create_task(session.serve())
+        for i in range(100):
+            run.publish({"type": "content_delta", "text": f"token{i} "})
+        await ws.incoming.put(json.dumps({"type": "chat", "conversation_id": "c1", "message": "hi"}))
+        await asyncio.sleep(0.1)
+        assert session._outbox.full()
+
+        # Pongs and errors have nowhere to go, but must not stall the cancel behind them
+        for _ in range(20):
+            await ws.incoming.put(json.dumps({"type": "ping"}))
+            await ws.incoming.put("not json")
+        await ws.incoming.put(json.dumps({"type": "cancel", "conversation_id": "c1"}))
+        await asyncio.sleep(0.1)
+        assert ws.incoming.empty()
+        assert run.scope.cancelled
+
+        await ws.incoming.put(None)
+        await asyncio.wait_for(serving, 1.0)
+
+    asyncio.run(scenario())
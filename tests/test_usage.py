@@ -0,0 +1,88 @@
+import asyncio
+import functools
+import json
+
+import pytest
+from starlette.testclient import TestClient
+
+import server.agent as agent
+import server.main as main
+from server.agent import DEADLINE_RESULT, run_agent
+from server.cancel import CancelScope
+from server.loop import LoopController
+from server.streams import RunRegistry
+from server.usage import Budget, RequestUsage
+
+ROUND_USAGE = {"prompt_tokens": 100, "completion_tokens": 10}
+
+
+@pytest.fixture
+def billed(upstreams, monkeypatch):
+    # Every LLM call reports 110 tokens
+    create = upstreams.chat.completions.create
+
+    async def billed_create(**kwargs):
+        resp = await create(**kwargs)
+        if not kwargs.get("stream"):
+            resp.usage = ROUND_USAGE
+        return resp
+
+    monkeypatch.setattr(upstreams.chat.completions, "create", billed_create)
+    upstreams.tool_seconds = 0.0
+    return upstreams
+
+
+def _run(budget, scope=None, stream=True):
+    usage = RequestUsage()
+
+    async def collect():
+        events = [event async for event in run_agent("Weather in Hangzhou?", usage=usage, budget=budget, scope=scope, stream=stream)]
+        # Taken before asyncio.run waits for an abandoned tool thread
+        return events, usage.elapsed
+
+    events, elapsed = asyncio.run(asyncio.wait_for(collect(), 5.0))
+    return events, usage, elapsed
+
+
+def test_token_budget_stops_the_loop_and_still_answers(billed):
+    events, usage, _ = _run(Budget(max_tokens=50, max_seconds=0))
+
+    assert usage.stopped == "token_budget"
+    assert usage.total.total_tokens == 110
+    assert [c["tool_choice"] for c in billed.llm_calls] == ["auto", "none"]
+    assert events[-1] == {"type": "content_delta", "text": "Sunny."}
+
+
+def test_latency_budget_cuts_off_a_slow_tool(upstreams, monkeypatch):
+    monkeypatch.setattr(agent, "LoopController", functools.partial(LoopController, reserve=0.5))
+    upstreams.tool_seconds = 2.0
+    events, usage, elapsed = _run(Budget(max_tokens=0, max_seconds=1.5), scope=CancelScope(None))
+
+    # The budget, not the (absent) request deadline, bounds the round
+    assert elapsed < 1.5
+    assert usage.stopped == "latency_budget"
+    assert {"type": "tool_result", "name": "get_weather", "result": DEADLINE_RESULT} in events
+    assert events[-1] == {"type": "content_delta", "text": "Sunny."}
+
+
+def test_request_deadline_wins_when_it_comes_first(upstreams, monkeypatch):
+    monkeypatch.setattr(agent, "LoopController", functools.partial(LoopController, reserve=0.5))
+    upstreams.tool_seconds = 2.0
+    _, usage, _ = _run(Budget(max_tokens=0, max_seconds=60), scope=CancelScope(1.5))
+
+    assert usage.stopped == "deadline"
+
+
+def test_stream_reports_usage_before_done(billed, monkeypatch):
+    monkeypatch.setattr(main, "runs", RunRegistry())
+    with TestClient(main.app) as client:
+        resp = client.post("/api/chat/stream", json={"message": "Weather in Hangzhou?", "session_id": "s1"})
+    events = [json.loads(line) for line in resp.text.splitlines() if line.strip()]
+
+    # Clients stop reading at `done`; the usage has to be in by then
+    assert [e["type"] for e in events[-2:]] == ["usage", "done"]
+    usage = events[-2]
+    # The tool round and the round that decided to answer; the stub stream reports none
+    assert usage["total"]["total_tokens"] == 220
+    assert usage["tools"]["get_weather"]["tool_calls"] == 1
+    assert usage["session"]["total_tokens"] == 220
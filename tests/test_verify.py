@@ -0,0 +1,93 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from typing import Any, List
+
+import pytest
+
+import server.verify as verify
+from server.verify import Verifier, parse_verdicts
+
+
+@pytest.mark.parametrize("text, count, expected", [
+    # The shape the judge is asked for, ids in any order
+    ('{"verdicts": [{"id": 0, "is_full_answer": true}, {"id": 1, "is_full_answer": false}]}', 2, [True, False]),
+    ('{"verdicts": [{"id": 1, "is_full_answer": "yes"}, {"id": 0, "is_full_answer": "no"}]}', 2, [False, True]),
+    ('{"results": [{"id": 0, "is_full_answer": 1}]}', 1, [True]),
+    # Missing ids stay unknown
+    ('{"verdicts": [{"id": 2, "is_full_answer": true}]}', 3, [None, None, True]),
+    # Drift: a bare list, by position or by id
+    ("[true, false, null]", 3, [True, False, None]),
+    ('[{"id": 1, "is_full_answer": true}, {"id": 0, "is_full_answer": false}]', 2, [False, True]),
+    # Drift: an id -> verdict map
+    ('{"0": true, "1": "false"}', 2, [True, False]),
+    # Drift: a single verdict, only meaningful for a batch of one
+    ('{"is_full_answer": "true"}', 1, [True]),
+    ('{"is_full_answer": true}', 2, [None, None]),
+    # Out-of-range and unusable ids are ignored
+    ('{"verdicts": [{"id": 5, "is_full_answer": true}, {"id": -1, "is_full_answer": true}]}', 2, [None, None]),
+    ('{"verdicts": [{"id": "x", "is_full_answer": true}, {"id": 1, "is_full_answer": true}]}', 2, [None, True]),
+    ("[true, true, true]", 2, [True, True]),
+    # Unparseable verdicts and malformed replies leave everything unknown
+    ('{"verdicts": [{"id": 0, "is_full_answer": "maybe"}]}', 1, [None]),
+    ('{"verdicts": {"id": 0}}', 1, [None]),
+    ('{"verdicts": [{"id": 0, "is_full_answer": true}', 1, [None]),
+    ("", 2, [None, None]),
+    ("not json", 1, [None]),
+    ('"true"', 1, [None]),
+])
+def test_parse_verdicts(text, count, expected):
+    assert parse_verdicts(text, count) == expected
+
+
+class JudgeLLM:
+    """Judges every answer containing "full" as a full answer."""
+
+    def __init__(self):
+        self.batches: List[List[Any]] = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs: Any) -> Any:
+        items = json.loads(kwargs["messages"][0]["content"].split("\n\n")[-1])
+        self.batches.append(items)
+        await asyncio.sleep(0.01)
+        verdicts = [{"id": item["id"], "is_full_answer": "full" in item["answer"]} for item in items]
+        message = SimpleNamespace(content=json.dumps({"verdicts": verdicts}))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+@pytest.fixture
+def judge(monkeypatch):
+    stub = JudgeLLM()
+    monkeypatch.setattr(verify, "llm", stub)
+    return stub
+
+
+def test_concurrent_verifies_share_one_judge_call(judge):
+    async def scenario():
+        verifier = Verifier(mode="async", batch_size=8, batch_window=0.05)
+        pairs = [(f"q{i}", "a full answer" if i % 2 else "partial") for i in range(5)]
+        # The same pair twice in one batch is judged once
+        results = await asyncio.gather(*[verifier.verify(q, a) for q, a in pairs + pairs[:1]])
+
+        assert len(judge.batches) == 1
+        assert len(judge.batches[0]) == 5
+        assert results == [(i % 2 == 1, False) for i in range(5)] + [(False, False)]
+
+        # A repeated pair is answered from the cache without another call
+        assert await verifier.verify("q1", "a full answer") == (True, True)
+        assert len(judge.batches) == 1
+
+    asyncio.run(scenario())
+
+
+def test_a_full_batch_is_judged_without_waiting_for_the_window(judge):
+    async def scenario():
+        verifier = Verifier(mode="async", batch_size=3, batch_window=10.0)
+        pairs = [(f"q{i}", "full") for i in range(6)]
+        results = await asyncio.wait_for(asyncio.gather(*[verifier.verify(q, a) for q, a in pairs]), 1.0)
+
+        assert [len(batch) for batch in judge.batches] == [3, 3]
+        assert results == [(True, False)] * 6
+
+    asyncio.run(scenario())
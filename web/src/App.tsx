@@ -7,10 +7,13 @@ import Markdown from './components/Markdown'
 import { Trash2 } from 'lucide-react'
 
 type EventItem =
-  | { type: 'start' }
+  | { type: 'start'; run_id: string }
   | { type: 'tool_call'; name: string; args: any }
   | { type: 'tool_result'; name: string; result: string }
   | { type: 'content_delta'; text: string }
+  | { type: 'usage'; total: Record<string, number>; tools: Record<string, Record<string, number>>; elapsed_ms: number; stopped?: string }
+  | { type: 'error'; error: string }
+  | { type: 'verdict'; is_full_answer: boolean | null; cached: boolean }
   | { type: 'done' }
 
 type ToolEvent =
@@ -33,40 +36,56 @@ function useChatStream() {
     setOutput('')
     setLoading(true)
 
-    const resp = await fetch('/api/chat/stream', {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ message }),
-      signal: controller.signal,
-    })
-    if (!resp.body) return
-
-    const reader = resp.body.getReader()
-    const decoder = new TextDecoder()
-    let buffer = ''
-    while (true) {
-      const { value, done } = await reader.read()
-      if (done) break
-      buffer += decoder.decode(value, { stream: true })
-      let idx: number
-      while ((idx = buffer.indexOf('\n')) !== -1) {
-        const line = buffer.slice(0, idx).trim()
-        buffer = buffer.slice(idx + 1)
-        if (!line) continue
-        try {
-          const evt: EventItem = JSON.parse(line)
-          setEvents(prev => [...prev, evt])
-          // Only hide when first displayable assistant text arrives
-          if (evt.type === 'content_delta' && evt.text) {
-            setLoading(false)
-            setOutput(prev => prev + (evt.text || ''))
-          } else if (evt.type === 'content_delta') {
-            // ensure we accumulate even empty chunks without hiding
-            setOutput(prev => prev + (evt.text || ''))
+    // Each event carries an id; if the connection drops we resume the same
+    // run from the last id we saw instead of re-sending the message.
+    let runId: string | null = null
+    let lastId = 0
+    let finished = false
+    for (let attempt = 0; attempt <= 3 && !finished && !controller.signal.aborted; attempt++) {
+      try {
+        const resp = await fetch('/api/chat/stream', {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify(runId ? { run_id: runId, last_event_id: lastId } : { message }),
+          signal: controller.signal,
+        })
+        if (!resp.ok || !resp.body) break
+
+        const reader = resp.body.getReader()
+        const decoder = new TextDecoder()
+        let buffer = ''
+        while (true) {
+          const { value, done } = await reader.read()
+          if (done) break
+          buffer += decoder.decode(value, { stream: true })
+          let idx: number
+          while ((idx = buffer.indexOf('\n')) !== -1) {
+            const line = buffer.slice(0, idx).trim()
+            buffer = buffer.slice(idx + 1)
+            if (!line) continue
+            try {
+              const evt: EventItem & { id?: number } = JSON.parse(line)
+              if (evt.id) lastId = evt.id
+              if (evt.type === 'start') runId = evt.run_id
+              if (evt.type === 'done') finished = true
+              setEvents(prev => [...prev, evt])
+              // Only hide when first displayable assistant text arrives
+              if (evt.type === 'content_delta' && evt.text) {
+                setLoading(false)
+                setOutput(prev => prev + (evt.text || ''))
+              } else if (evt.type === 'content_delta') {
+                // ensure we accumulate even empty chunks without hiding
+                setOutput(prev => prev + (evt.text || ''))
+              }
+            } catch {
+              // ignore parse errors
+            }
           }
-        } catch {
-          // ignore parse errors
         }
+        if (!runId) break
+      } catch {
+        if (controller.signal.aborted || !runId) break
+        await new Promise(r => setTimeout(r, 500 * (attempt + 1)))
       }
     }
     setLoading(false)